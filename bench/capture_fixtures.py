@@ -0,0 +1,132 @@
+"""Enregistre de vraies pages khamsat.com comme fixtures du banc de mesure.
+
+Usage : python bench/capture_fixtures.py [--category URL] [--listing URL] [--max-services N] [--dir DOSSIER]
+
+Télécharge la page catégorie, la première page d'une sous-catégorie et sa
+page suivante (endpoint 'Voir plus'), puis parcourt les services du listing
+jusqu'à trouver un exemplaire de chaque variante (complet, sans avis, sans
+tags). Les pages sont allégées (scripts, styles, SVG et commentaires
+retirés) sans toucher aux éléments lus par les sélecteurs, et
+fixtures/CAPTURE.json garde la date de capture et l'URL de chaque fixture.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lxml import etree  # noqa: E402
+from lxml import html as lxml_html  # noqa: E402
+
+from http_client import FetchError, fetch, make_session  # noqa: E402
+from listing_crawler import (  # noqa: E402
+    LOAD_MORE_XPATH, _html_from_response, parse_listing_page, with_query
+)
+from rate_limit import HostRateLimiter  # noqa: E402
+from service_extract import missing_required, parse_service_html  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+CATEGORY_URL = "https://khamsat.com/programming"
+LISTING_URL = "https://khamsat.com/programming/web-development"
+
+# Éléments sans effet sur les XPath de listing_crawler et service_extract
+STRIPPED_TAGS = ("script", "style", "noscript", "svg", "iframe", "template", etree.Comment)
+
+
+def trim(content):
+    """Page allégée (utf-8) ; le bouton 'Voir plus' pointe vers un chemin relatif."""
+    tree = lxml_html.document_fromstring(content)
+    etree.strip_elements(tree, *STRIPPED_TAGS, with_tail=False)
+    for button in tree.xpath(LOAD_MORE_XPATH):
+        for name in ("data-url", "data-href", "data-action", "href"):
+            value = button.get(name)
+            if value and value.startswith(("http://", "https://", "//")):
+                parsed = urlparse(value)
+                button.set(name, parsed.path + (f"?{parsed.query}" if parsed.query else ""))
+    return lxml_html.tostring(tree, encoding="utf-8", doctype="<!DOCTYPE html>")
+
+
+def service_variant(result):
+    """Variante couverte par une page de service, ou None si elle est inexploitable."""
+    if result.status == "error" or missing_required(result):
+        return None
+    if not result.last_date:
+        return "service_no_reviews"
+    if not result.keywords:
+        return "service_no_tags"
+    return "service_full"
+
+
+def capture(category_url, listing_url, max_services, directory=FIXTURES):
+    session = make_session()
+    limiter = HostRateLimiter(0.5)
+    pages = {}
+
+    def get(url):
+        response = fetch(session, url, limiter, raise_errors=True)
+        print(f"⬇️ {url} ({len(response.content)} octets)")
+        return response
+
+    def save(name, url, body):
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(body)
+        pages[name] = {"url": url, "sha256": hashlib.sha256(body).hexdigest()}
+
+    try:
+        save("category_programming.html", category_url, trim(get(category_url).content))
+
+        response = get(listing_url)
+        rows, (endpoint, param, value, _) = parse_listing_page(response.content, "capture", listing_url, listing_url)
+        save("listing_page1.html", listing_url, trim(response.content))
+        page_url = with_query(endpoint, **{param: value})
+        save("listing_page2.html", page_url, trim(_html_from_response(get(page_url))))
+
+        wanted = {"service_full", "service_no_reviews", "service_no_tags"}
+        for row in rows[:max_services]:
+            if not wanted:
+                break
+            link = row[2]
+            try:
+                content = get(link).content
+            except FetchError as e:
+                print(f"⚠️ {link} ignoré ({e.reason})")
+                continue
+            variant = service_variant(parse_service_html(content, link))
+            if variant in wanted:
+                save(f"{variant}.html", link, trim(content))
+                wanted.discard(variant)
+        if wanted:
+            print(f"⚠️ Variantes introuvables dans les {max_services} premiers services : "
+                  f"{', '.join(sorted(wanted))} (anciennes fixtures conservées)")
+    finally:
+        session.close()
+
+    manifest = {
+        "captured_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "pagination": {"path": urlparse(endpoint).path, "param": param, "value": value},
+        "pages": pages,
+    }
+    with open(os.path.join(directory, "CAPTURE.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    print(f"📼 {len(pages)} fixtures enregistrées le {manifest['captured_at']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture des fixtures du banc de mesure")
+    parser.add_argument("--category", default=CATEGORY_URL, help="catégorie à enregistrer")
+    parser.add_argument("--listing", default=LISTING_URL, help="sous-catégorie à enregistrer")
+    parser.add_argument("--max-services", type=int, default=40,
+                        help="services du listing essayés pour trouver chaque variante")
+    parser.add_argument("--dir", default=FIXTURES, help="dossier des fixtures")
+    args = parser.parse_args()
+    capture(args.category, args.listing, args.max_services, args.dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""Banc de mesure des parseurs et extracteurs sur des pages figées.
+
+Usage : python bench/run_bench.py [--iterations N] [--browser] [--output rapport.json] [--baseline]
+
+Les fixtures de bench/fixtures sont servies par un serveur HTTP local ; le
+rapport JSON donne pages/s, latence par champ (ms) et RSS max (Mo), ainsi
+que des contrôles de comportement (code de sortie 1 si l'un échoue).
+
+Les fixtures d'origine sont écrites à la main d'après les sélecteurs ;
+bench/capture_fixtures.py les remplace par de vraies pages, et
+fixtures/CAPTURE.json (date de capture, URLs) est alors repris dans le rapport.
+Seuls les chiffres mesurés sur des pages enregistrées font référence :
+--baseline écrit bench/baseline.json et est refusé sans CAPTURE.json
+(workflow 'Bench fixtures' pour capturer et enregistrer une référence).
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lxml import html as lxml_html  # noqa: E402
+
+from http_client import FetchError, make_session  # noqa: E402
+from listing_crawler import LOAD_MORE_XPATH, crawl_listing, extract_page_data, parse_cards, parse_tree  # noqa: E402
+from service_extract import (  # noqa: E402
+    EXTRACT_FIELDS_ARGS, EXTRACT_FIELDS_JS, FIELD_XPATHS, TAGS_XPATH,
+    FieldTimings, browser_result, fetch_service_details, parse_service_html
+)
+from url_classifier import UrlClassifier  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+CATEGORY_URL = "https://khamsat.com/programming"
+LISTING_URL = "https://khamsat.com/programming/web-development"
+SERVICE_FIXTURES = ("service_full", "service_no_reviews", "service_no_tags")
+
+# Chemin servi -> fixture ; l'endpoint paginé choisit sa page via ?page=
+ROUTES = {
+    "/programming": "category_programming.html",
+    "/programming/web-development": "listing_page1.html",
+    "/programming/web-development/1000000-service-full": "service_full.html",
+    "/programming/web-development/1000001-service-no-reviews": "service_no_reviews.html",
+    "/programming/web-development/1000002-service-no-tags": "service_no_tags.html",
+}
+def load_capture():
+    """Manifeste des fixtures enregistrées, None pour les fixtures écrites à la main."""
+    path = os.path.join(FIXTURES, "CAPTURE.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+CAPTURE = load_capture()
+# Endpoint 'Voir plus' : celui de la page enregistrée, sinon celui des fixtures écrites à la main
+PAGINATION = (CAPTURE or {}).get("pagination", {"path": "/ajax/services/list", "param": "page", "value": 2})
+PAGES = {str(PAGINATION["value"]): "listing_page2.html"}
+# Listing dont le bouton 'Voir plus' n'a pas d'endpoint et dont le serveur
+# ignore ?page= : la page 1 revient à la place de la page 2
+REPEAT_PATH = "/programming/page-param-ignored"
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), "rb") as f:
+        return f.read()
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    """Sert les fixtures comme le ferait khamsat.com (HTML utf-8)."""
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == REPEAT_PATH:
+            self.send_body(repeating_listing())
+            return
+        if parsed.path == PAGINATION["path"]:
+            page = parse_qs(parsed.query).get(PAGINATION["param"], [""])[0]
+            name = PAGES.get(page, "listing_empty.html")
+        else:
+            name = ROUTES.get(parsed.path.rstrip("/"))
+        if name is None:
+            self.send_error(404)
+            return
+        self.send_body(fixture(name))
+
+    def send_body(self, body):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def repeating_listing():
+    """Page 1 dont le bouton 'Voir plus' a perdu ses attributs d'endpoint."""
+    tree = lxml_html.document_fromstring(fixture("listing_page1.html"))
+    for button in tree.xpath(LOAD_MORE_XPATH):
+        for name in ("data-url", "data-href", "data-action", "href"):
+            button.attrib.pop(name, None)
+    return lxml_html.tostring(tree, encoding="utf-8")
+
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def timed(func, iterations):
+    """Exécute `func` `iterations` fois ; retourne (secondes, dernier résultat)."""
+    result = None
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = func()
+    return time.perf_counter() - start, result
+
+
+def rate(pages, seconds):
+    return round(pages / seconds, 1) if seconds else None
+
+
+def bench_link_filter(iterations):
+    """rac2 : classement des liens d'une page catégorie."""
+    content = fixture("category_programming.html")
+    classifier = UrlClassifier([CATEGORY_URL, "https://khamsat.com/designing"])
+    seconds, found = timed(lambda: classifier.subcategories(content, CATEGORY_URL), iterations)
+    return {"pages_per_sec": rate(iterations, seconds), "subcategories": len(found)}
+
+
+def bench_card_extraction(iterations, base_url):
+    """rac3 : extraction des cartes (lxml), puis pagination complète via HTTP local."""
+    content = fixture("listing_page1.html")
+    seconds, rows = timed(lambda: parse_cards(parse_tree(content), "bench", LISTING_URL), iterations)
+    report = {"parse_pages_per_sec": rate(iterations, seconds), "cards_per_page": len(rows)}
+
+    session = make_session()
+    try:
+        crawls = max(1, iterations // 10)
+        start = time.perf_counter()
+        pages = services = 0
+        for _ in range(crawls):
+            for page in crawl_listing(session, f"{base_url}/programming/web-development", "bench"):
+                pages += 1
+                services += len(page)
+        seconds = time.perf_counter() - start
+    finally:
+        session.close()
+    report.update({"crawl_pages_per_sec": rate(pages, seconds), "crawl_services": services // crawls})
+    return report
+
+
+def check_repeated_page(base_url):
+    """Une page 2 qui répète la page 1 doit faire échouer le crawl, pas le terminer."""
+    session = make_session()
+    try:
+        pages = crawl_listing(session, f"{base_url}{REPEAT_PATH}", "bench")
+        list(pages)
+    except FetchError as e:
+        return {"ok": e.reason == "pagination_stalled", "reason": e.reason}
+    finally:
+        session.close()
+    return {"ok": False, "reason": "listing accepté comme complet"}
+
+
+def field_latencies(content):
+    """Durée (ms) de chaque XPath de FIELD_XPATHS sur un arbre déjà parsé."""
+    tree = lxml_html.fromstring(content)
+    timings = {}
+    for field, xpath in list(FIELD_XPATHS.items()) + [("keywords", TAGS_XPATH)]:
+        start = time.perf_counter()
+        tree.xpath(xpath)
+        timings[field] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def bench_service_http(iterations, base_url):
+    """rac4 : parse lxml de chaque fixture, puis extract via fetch_service_details."""
+    report = {}
+    latencies = FieldTimings()
+    for name in SERVICE_FIXTURES:
+        content = fixture(f"{name}.html")
+        seconds, result = timed(lambda: parse_service_html(content, name), iterations)
+        for _ in range(min(iterations, 50)):
+            latencies.add(field_latencies(content))
+        report[name] = {"parse_pages_per_sec": rate(iterations, seconds),
+                        "last_date": result.last_date, "keywords": ", ".join(result.keywords)}
+
+    session = make_session()
+    try:
+        links = [f"{base_url}{path}" for path, name in ROUTES.items() if name.startswith("service_")]
+        start = time.perf_counter()
+        fetched = 0
+        for _ in range(max(1, iterations // 10)):
+            for link in links:
+                if fetch_service_details(session, link).status != "error":
+                    fetched += 1
+        report["fetch_pages_per_sec"] = rate(fetched, time.perf_counter() - start)
+    finally:
+        session.close()
+    report["field_latency_ms"] = field_summary(latencies)
+    return report
+
+
+def field_summary(timings):
+    return {field: {"mean": round(total / count, 3), "max": round(peak, 3)}
+            for field, (count, total, peak) in timings.stats.items()}
+
+
+def bench_browser(iterations, base_url, lean):
+    """Chemins Selenium de rac3 (cartes) et rac4 (champs) ; ignoré sans Chrome."""
+    try:
+        from browser import init_driver, page_traffic
+        driver = init_driver(lean=lean)
+    except Exception as e:
+        return {"skipped": str(e).splitlines()[0] if str(e) else type(e).__name__}
+
+    report = {}
+    try:
+        runs = max(1, iterations // 10)
+        driver.get(f"{base_url}/programming/web-development")
+        seconds, (rows, _) = timed(lambda: extract_page_data(driver, "bench"), runs)
+        report["cards"] = {"reads_per_sec": rate(runs, seconds), "cards_per_page": len(rows)}
+
+        latencies = FieldTimings()
+        links = [f"{base_url}{path}" for path, name in ROUTES.items() if name.startswith("service_")]
+        page_traffic(driver)
+        start = time.perf_counter()
+        for _ in range(runs):
+            for link in links:
+                driver.get(link)
+                _, timings = browser_result(driver.execute_script(EXTRACT_FIELDS_JS, EXTRACT_FIELDS_ARGS), link)
+                latencies.add(timings)
+        seconds = time.perf_counter() - start
+        received, requests, blocked = page_traffic(driver)
+        pages = runs * len(links)
+        report["service"] = {"pages_per_sec": rate(pages, seconds),
+                             "field_latency_ms": field_summary(latencies),
+                             "bytes_per_page": round(received / pages),
+                             "requests_per_page": round(requests / pages, 1),
+                             "blocked_per_page": round(blocked / pages, 1)}
+    finally:
+        driver.quit()
+    return report
+
+
+def peak_rss_mb():
+    # ru_maxrss est en Ko sous Linux ; "children" couvre Chrome et chromedriver
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc de mesure des extracteurs khamsat")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--browser", action="store_true",
+                        help="mesure aussi les chemins Selenium (profil économe et complet)")
+    parser.add_argument("--output", help="fichier JSON (sinon sortie standard)")
+    parser.add_argument("--baseline", action="store_true",
+                        help=f"enregistre le rapport comme référence ({os.path.relpath(BASELINE, ROOT)})")
+    args = parser.parse_args()
+    if args.baseline and not CAPTURE:
+        parser.error("--baseline exige des fixtures enregistrées (python bench/capture_fixtures.py)")
+    if not CAPTURE:
+        print("⚠️ Fixtures écrites à la main : chiffres indicatifs, pas une référence", file=sys.stderr)
+
+    server, base_url = start_server()
+    try:
+        results = {
+            "rac2_link_filter": bench_link_filter(args.iterations),
+            "rac3_card_extraction": bench_card_extraction(args.iterations, base_url),
+            "rac4_service_http": bench_service_http(args.iterations, base_url),
+        }
+        if args.browser:
+            results["browser"] = {"lean": bench_browser(args.iterations, base_url, True),
+                                  "full": bench_browser(args.iterations, base_url, False)}
+        # Contrôles de comportement : un échec rend le code de sortie non nul
+        checks = {"repeated_page_rejected": check_repeated_page(base_url)}
+    finally:
+        server.shutdown()
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "iterations": args.iterations,
+        "fixtures": {"captured_at": CAPTURE["captured_at"]} if CAPTURE else "hand-written",
+        "results": results,
+        "checks": checks,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    for path in filter(None, (args.output, args.baseline and BASELINE)):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if not args.output:
+        print(text)
+    failed = [name for name, check in checks.items() if not check["ok"]]
+    if failed:
+        print(f"❌ Contrôles en échec : {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+from metrics import metrics
+from rate_limit import browser_class
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+# Motifs Network.setBlockedURLs par catégorie (le "*" final couvre les query strings)
+BLOCK_PATTERNS = {
+    "images": ["*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.webp*", "*.svg*", "*.ico*"],
+    "fonts": ["*.woff*", "*.ttf*", "*.otf*", "*.eot*", "*fonts.googleapis.com*", "*fonts.gstatic.com*"],
+    "media": ["*.mp4*", "*.webm*", "*.mp3*", "*.m3u8*"],
+    "stylesheets": ["*.css*"],
+    "trackers": ["*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+                 "*googlesyndication.com*", "*googleadservices.com*", "*connect.facebook.net*",
+                 "*facebook.com/tr*", "*hotjar.com*", "*clarity.ms*", "*intercom.io*",
+                 "*onesignal.com*", "*sentry.io*"],
+}
+
+# Sous-systèmes de Chrome inutiles pour lire le DOM
+LEAN_ARGUMENTS = [
+    "--blink-settings=imagesEnabled=false",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-background-timer-throttling",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-features=Translate,MediaRouter,OptimizationHints,AutofillServerCommunication",
+    "--mute-audio",
+    "--no-first-run",
+    "--window-size=1280,800",
+]
+
+# Mode économe (KHAMSAT_BROWSER_LEAN) : catégories bloquées
+# (KHAMSAT_BROWSER_BLOCK) et une page sur KHAMSAT_BROWSER_SAMPLE rechargée
+# sans blocage pour mesurer l'économie (0 = jamais)
+LEAN = os.environ.get("KHAMSAT_BROWSER_LEAN", "1") == "1"
+BLOCK = [kind.strip() for kind in os.environ.get("KHAMSAT_BROWSER_BLOCK", "images,fonts,media,trackers").split(",")
+         if kind.strip()]
+SAMPLE_EVERY = int(os.environ.get("KHAMSAT_BROWSER_SAMPLE", "50"))
+
+_pages = 0
+_pages_lock = threading.Lock()
+
+
+def blocked_patterns(kinds):
+    patterns = []
+    for kind in kinds:
+        if kind not in BLOCK_PATTERNS:
+            raise ValueError(f"Catégorie de ressources inconnue : {kind}")
+        patterns.extend(BLOCK_PATTERNS[kind])
+    return patterns
+
+
+def init_driver(lean=None, block=None):
+    """Chrome headless des scripts.
+
+    En mode économe : stratégie de chargement "eager", images, polices,
+    médias et trackers bloqués via CDP, sous-systèmes inutiles désactivés.
+    Le journal "performance" sert au décompte des octets (page_traffic).
+    """
+    lean = LEAN if lean is None else lean
+    options = Options()
+    for argument in ("--headless", "--no-sandbox", "--disable-dev-shm-usage", "--disable-gpu",
+                     f"user-agent={USER_AGENT}"):
+        options.add_argument(argument)
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    if lean:
+        options.page_load_strategy = "eager"
+        for argument in LEAN_ARGUMENTS:
+            options.add_argument(argument)
+    else:
+        options.add_argument("--window-size=1920,1080")
+
+    driver = webdriver.Chrome(options=options)
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.blocked_urls = blocked_patterns(BLOCK if block is None else block) if lean else []
+    if driver.blocked_urls:
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": driver.blocked_urls})
+    return driver
+
+
+def page_traffic(driver):
+    """Octets reçus, requêtes et requêtes bloquées depuis le dernier appel (vide le journal)."""
+    received = requests = blocked = 0
+    for entry in driver.get_log("performance"):
+        message = json.loads(entry["message"])["message"]
+        method = message.get("method")
+        if method == "Network.loadingFinished":
+            received += message["params"].get("encodedDataLength", 0)
+        elif method == "Network.requestWillBeSent":
+            requests += 1
+        elif method == "Network.loadingFailed" and message["params"].get("blockedReason"):
+            blocked += 1
+    return int(received), requests, blocked
+
+
+def record_page(driver, url=None, limiter=None):
+    """Comptabilise le trafic de la page courante dans les métriques.
+
+    Une page sur SAMPLE_EVERY est rechargée sans blocage (si `url` est fourni)
+    pour estimer l'économie par page du mode économe : à n'appeler qu'une fois
+    par page, après l'extraction, car le rechargement remplace la page courante.
+    Le rechargement prend son jeton dans la classe navigateur de `limiter`.
+    """
+    global _pages
+    received, requests, blocked = page_traffic(driver)
+    metrics.inc("browser_pages_total")
+    metrics.inc("browser_bytes_total", received)
+    metrics.inc("browser_requests_total", requests)
+    metrics.inc("browser_blocked_requests_total", blocked)
+
+    with _pages_lock:
+        _pages += 1
+        sample = url and SAMPLE_EVERY > 0 and getattr(driver, "blocked_urls", None) and _pages % SAMPLE_EVERY == 0
+    if not sample:
+        return
+    if limiter:
+        limiter.acquire(url, browser_class(url))
+    try:
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": []})
+        driver.get(url)
+        full, _, _ = page_traffic(driver)
+        metrics.inc("browser_sampled_pages_total")
+        metrics.inc("browser_sampled_bytes_total", received)
+        metrics.inc("browser_sampled_full_bytes_total", full)
+    finally:
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": driver.blocked_urls})
+
+
+def traffic_summary():
+    """Bande passante du run et économie par page estimée sur les pages échantillonnées."""
+    pages = metrics.total("browser_pages_total")
+    if not pages:
+        return {}
+    summary = {
+        "lean": LEAN,
+        "pages": pages,
+        "bytes": metrics.total("browser_bytes_total"),
+        "bytes_per_page": round(metrics.total("browser_bytes_total") / pages),
+        "blocked_requests_per_page": round(metrics.total("browser_blocked_requests_total") / pages, 1),
+    }
+    sampled = metrics.total("browser_sampled_pages_total")
+    if sampled:
+        lean_bytes = metrics.total("browser_sampled_bytes_total")
+        full_bytes = metrics.total("browser_sampled_full_bytes_total")
+        summary["sampled_pages"] = sampled
+        summary["saved_bytes_per_page"] = round((full_bytes - lean_bytes) / sampled)
+        summary["saved_ratio"] = round(1 - lean_bytes / full_bytes, 3) if full_bytes else 0.0
+    return summary
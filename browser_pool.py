@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+
+from selenium.common.exceptions import WebDriverException
+
+from fetch_pool import ordered_map
+from metrics import metrics
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def process_tree_rss_mb(pid):
+    """Mémoire résidente (Mo) d'un processus et de ses descendants, via /proc (Linux)."""
+    children = {}
+    rss = {}
+    try:
+        entries = [e for e in os.listdir("/proc") if e.isdigit()]
+    except OSError:
+        return 0.0
+    for entry in entries:
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                stat = f.read().decode("utf-8", "replace")
+        except OSError:
+            continue
+        # Le nom du processus (champ 2) peut contenir des espaces : on coupe après ')'
+        fields = stat[stat.rfind(")") + 2:].split()
+        child = int(entry)
+        children.setdefault(int(fields[1]), []).append(child)
+        rss[child] = int(fields[21]) * PAGE_SIZE
+
+    total = 0
+    todo = [pid]
+    while todo:
+        current = todo.pop()
+        total += rss.get(current, 0)
+        todo.extend(children.get(current, []))
+    return total / (1024 * 1024)
+
+
+class BrowserPool:
+    """K instances Chrome (une par thread) qui consomment une file de tâches commune.
+
+    Chaque driver est recyclé après `max_pages` pages ou si Chrome dépasse
+    `max_rss_mb`, et redémarré puis la tâche relancée une fois s'il plante.
+    """
+
+    def __init__(self, factory, size, max_pages=25, max_rss_mb=1500, log=None):
+        self.factory = factory
+        self.size = size
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.log = log or (lambda msg, level="info": None)
+        self._local = threading.local()
+        self._drivers = set()
+        self._lock = threading.Lock()
+
+    def _start(self):
+        driver = self.factory()
+        with self._lock:
+            self._drivers.add(driver)
+        self._local.driver = driver
+        self._local.pages = 0
+        return driver
+
+    def _stop(self):
+        driver = getattr(self._local, "driver", None)
+        self._local.driver = None
+        if driver is None:
+            return
+        with self._lock:
+            self._drivers.discard(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _driver_rss_mb(self, driver):
+        process = getattr(getattr(driver, "service", None), "process", None)
+        return process_tree_rss_mb(process.pid) if process else 0.0
+
+    def _recycle_if_needed(self):
+        driver = self._local.driver
+        if self._local.pages >= self.max_pages:
+            self.log(f"   ♻️ Recyclage Chrome après {self._local.pages} pages")
+            metrics.inc("browser_recycles_total", reason="pages")
+            self._stop()
+        elif self.max_rss_mb and self._driver_rss_mb(driver) > self.max_rss_mb:
+            self.log(f"   ♻️ Recyclage Chrome (mémoire > {self.max_rss_mb} Mo)")
+            metrics.inc("browser_recycles_total", reason="memory")
+            self._stop()
+
+    def _run_task(self, task, item):
+        """Exécute une tâche ; toute exception, démarrage de Chrome compris, reste propre à l'item."""
+        start = time.perf_counter()
+        try:
+            driver = getattr(self._local, "driver", None) or self._start()
+            try:
+                result = task(driver, item)
+            except WebDriverException as e:
+                self.log(f"   💥 Chrome planté ({e.__class__.__name__}), redémarrage", "warning")
+                metrics.inc("browser_recycles_total", reason="crash")
+                self._stop()
+                result = task(self._start(), item)
+        finally:
+            metrics.observe("browser_task_seconds", time.perf_counter() - start)
+            if getattr(self._local, "driver", None) is not None:
+                self._local.pages += 1
+                self._recycle_if_needed()
+        return result
+
+    def map(self, task, items):
+        """Exécute `task(driver, item)` sur le pool.
+
+        Renvoie des (item, résultat, exception) dans l'ordre des items ; une
+        tâche en échec n'interrompt pas les autres.
+        """
+        return ordered_map(lambda i: self._run_task(task, i), items, self.size, name="browser")
+
+    def close(self):
+        with self._lock:
+            drivers = list(self._drivers)
+            self._drivers.clear()
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
@@ -0,0 +1,39 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+
+
+def _outcome(item, future):
+    try:
+        return item, future.result(), None
+    except Exception as e:
+        return item, None, e
+
+
+def ordered_map(func, items, workers, max_pending=None, name=None):
+    """Applique `func` en parallèle et renvoie les (item, résultat, exception) dans l'ordre d'entrée.
+
+    Un item en échec donne (item, None, exception) sans interrompre les autres.
+
+    Au plus `max_pending` tâches sont en vol : les items sont consommés au fur et
+    à mesure, et un résultat lent ne bloque que l'écriture, pas les requêtes.
+    Avec `name`, la profondeur de la file est publiée dans la jauge queue_depth.
+    """
+    max_pending = max_pending or workers * 2
+    pending = deque()
+    items = iter(items)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for item in items:
+                pending.append((item, executor.submit(func, item)))
+                if name:
+                    metrics.set("queue_depth", len(pending), pool=name)
+                if len(pending) >= max_pending:
+                    yield _outcome(*pending.popleft())
+            while pending:
+                yield _outcome(*pending.popleft())
+        finally:
+            for _, future in pending:
+                future.cancel()
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import time
+import zlib
+
+from fsutils import atomic_open
+
+
+class CachedResponse:
+    """Réponse rejouée depuis le cache, compatible avec ce que lisent les parseurs."""
+
+    def __init__(self, url, content, content_type="", unchanged=False):
+        self.url = url
+        self.status_code = 200
+        self.content = content
+        self.headers = {"Content-Type": content_type}
+        # True si le serveur a répondu 304 ou si le corps a le même hash qu'avant
+        self.unchanged = unchanged
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", "replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class HttpCache:
+    """Cache disque des réponses, indexé par URL, pour les requêtes conditionnelles.
+
+    Garde ETag / Last-Modified et le hash du corps (compressé) ; les entrées
+    plus vieilles que `ttl` secondes sont ignorées et `prune()` évince les
+    moins récemment utilisées au-delà de `max_bytes`.
+    """
+
+    def __init__(self, directory, max_bytes=500 * 1024 * 1024, ttl=45 * 86400):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, url):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        folder = os.path.join(self.directory, key[:2])
+        return os.path.join(folder, key + ".json"), os.path.join(folder, key + ".body")
+
+    def _lookup(self, url):
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self.ttl and time.time() - meta.get("stored_at", 0) > self.ttl:
+            self._remove(meta_path, body_path)
+            return None
+        if not os.path.exists(body_path):
+            return None
+        return meta
+
+    @staticmethod
+    def _remove(*paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def conditional_headers(self, url):
+        """En-têtes If-None-Match / If-Modified-Since pour une URL déjà en cache."""
+        meta = self._lookup(url)
+        headers = {}
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def replay(self, url):
+        """Réponse 304 : renvoie le corps en cache, marqué comme inchangé (None s'il a disparu)."""
+        meta = self._lookup(url)
+        if meta is None:
+            return None
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(body_path, "rb") as f:
+                content = zlib.decompress(f.read())
+        except (OSError, zlib.error):
+            # Corps évincé ou illisible entre la requête conditionnelle et le 304
+            return None
+        os.utime(meta_path)
+        return CachedResponse(url, content, meta.get("content_type", ""), unchanged=True)
+
+    def store(self, url, response):
+        """Enregistre une réponse 200 et indique si son contenu a changé."""
+        content = response.content
+        digest = hashlib.sha256(content).hexdigest()
+        previous = self._lookup(url)
+        unchanged = previous is not None and previous.get("sha256") == digest
+
+        meta_path, body_path = self._paths(url)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        if not unchanged:
+            with atomic_open(body_path, "wb") as f:
+                f.write(zlib.compress(content))
+        meta = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_type": response.headers.get("Content-Type", ""),
+            "sha256": digest,
+            "stored_at": time.time(),
+        }
+        with atomic_open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        return CachedResponse(url, content, meta["content_type"], unchanged=unchanged)
+
+    def prune(self):
+        """Évince les entrées les moins récemment utilisées au-delà de max_bytes."""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                meta_path = os.path.join(root, name)
+                body_path = meta_path[:-len(".json")] + ".body"
+                try:
+                    size = os.path.getsize(meta_path) + os.path.getsize(body_path)
+                    last_used = os.path.getmtime(meta_path)
+                except OSError:
+                    self._remove(meta_path, body_path)
+                    continue
+                entries.append((last_used, size, meta_path, body_path))
+                total += size
+
+        removed = 0
+        for _, size, meta_path, body_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(meta_path, body_path)
+            total -= size
+            removed += 1
+        return removed, total
+
+
+def cache_from_env():
+    """Cache configuré par KHAMSAT_HTTP_CACHE (dossier, vide = désactivé)."""
+    directory = os.environ.get("KHAMSAT_HTTP_CACHE", os.path.join(os.getcwd(), ".cache", "http"))
+    if not directory:
+        return None
+    max_mb = int(os.environ.get("KHAMSAT_HTTP_CACHE_MB", "500"))
+    ttl_days = float(os.environ.get("KHAMSAT_HTTP_CACHE_TTL_DAYS", "45"))
+    return HttpCache(directory, max_mb * 1024 * 1024, ttl_days * 86400)
@@ -0,0 +1,107 @@
+import time
+from urllib.parse import urlparse
+
+import requests
+from urllib3.util.retry import Retry
+
+from metrics import metrics
+from rate_limit import is_challenge, parse_retry_after
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
+}
+
+
+class FetchError(Exception):
+    """Échec d'un fetch ; `reason` vaut "http_<code>", "challenge" ou le nom de l'exception réseau."""
+
+    def __init__(self, url, reason):
+        super().__init__(f"{reason} : {url}")
+        self.url = url
+        self.reason = reason
+
+
+def make_session(pool_size=10, retries=3):
+    """Session HTTP partagée (keep-alive) dimensionnée pour `pool_size` threads.
+
+    Les erreurs de connexion et les 500/502/504 sont réessayées avec backoff ;
+    429/503 restent gérés par `fetch` et le limiteur de débit.
+    """
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(500, 502, 504),
+                  allowed_methods=("GET", "HEAD"), raise_on_status=False)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                                            max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def fetch(session, url, limiter=None, timeout=15, max_retries=3, cache=None, raise_errors=False):
+    """GET limité par hôte. Retourne la réponse 200, ou None en cas d'échec
+    (FetchError levée à la place avec `raise_errors`).
+
+    Avec un `limiter` (HostRateLimiter), chaque requête attend son jeton ; les
+    réponses 429/503 et les pages de captcha ralentissent la classe d'endpoint
+    avant de réessayer, les erreurs et la latence des réponses ajustent son
+    débit. Avec un `cache` (HttpCache), la requête est conditionnelle et la
+    réponse porte `unchanged=True` sur un 304 ou un corps identique.
+    """
+    def fail(reason):
+        if raise_errors:
+            raise FetchError(url, reason)
+        return None
+
+    headers = cache.conditional_headers(url) if cache else {}
+    host = urlparse(url).netloc
+    reason = "retries_exhausted"
+    for _ in range(max_retries + 1):
+        if limiter:
+            limiter.acquire(url)
+        start = time.perf_counter()
+        try:
+            response = session.get(url, timeout=timeout, headers=headers)
+        except requests.RequestException as e:
+            metrics.inc("http_errors_total", host=host, error=e.__class__.__name__)
+            if limiter:
+                limiter.error(url)
+            return fail(e.__class__.__name__)
+        latency = time.perf_counter() - start
+        metrics.observe("http_fetch_seconds", latency, host=host)
+        metrics.inc("http_requests_total", host=host, status=response.status_code)
+        metrics.inc("http_bytes_total", len(response.content), host=host)
+
+        challenge = is_challenge(response)
+        if challenge:
+            metrics.inc("http_challenges_total", host=host)
+        if (response.status_code in (429, 503) or challenge) and limiter:
+            reason = "challenge" if challenge else f"http_{response.status_code}"
+            metrics.inc("http_retries_total", host=host, status=response.status_code)
+            limiter.backoff(url, parse_retry_after(response.headers.get("Retry-After")),
+                            reason="challenge" if challenge else str(response.status_code))
+            continue
+        if challenge:
+            return fail("challenge")
+        if limiter:
+            if response.status_code >= 500:
+                limiter.error(url)
+            else:
+                limiter.recover(url, latency)
+        if response.status_code == 304 and cache:
+            replayed = cache.replay(url)
+            if replayed is not None:
+                metrics.inc("http_cache_total", result="not_modified")
+                return replayed
+            # Corps en cache perdu entre-temps : nouvelle requête, sans condition
+            metrics.inc("http_cache_total", result="replay_miss")
+            headers = {}
+            continue
+        if response.status_code != 200:
+            return fail(f"http_{response.status_code}")
+        if not cache:
+            return response
+        response = cache.store(url, response)
+        metrics.inc("http_cache_total", result="unchanged" if response.unchanged else "changed")
+        return response
+    return fail(reason)
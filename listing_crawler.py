@@ -0,0 +1,205 @@
+from collections import deque
+from urllib.parse import urljoin, urlparse, parse_qsl, urlencode, urlunparse
+
+from lxml import etree
+from lxml import html as lxml_html
+
+from http_client import FetchError, fetch
+from parse_pool import INLINE
+from records import NO_IMAGE, Listing
+
+# Mêmes sélecteurs que extract_page_data (mode Selenium)
+CARD_XPATH = "//div[starts-with(@id,'service-')]"
+LINK_XPATH = ".//div/div[2]/h4/a"
+IMG_XPATH = ".//div/div[1]//img"
+LOAD_MORE_XPATH = '//*[@id="load_more_content"]'
+
+# Garde-fou si l'endpoint renvoie toujours la même page
+MAX_PAGES = 10000
+
+# Mode Selenium : lit toutes les cartes à partir de l'index arguments[0] en un
+# seul appel WebDriver (mêmes XPath que le mode HTTP). Une carte sans lien vaut null.
+EXTRACT_CARDS_JS = """
+var start = arguments[0];
+var cards = document.evaluate("%s", document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+var first = function (xpath, node) {
+    return document.evaluate(xpath, node, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+};
+var rows = [];
+for (var i = start; i < cards.snapshotLength; i++) {
+    var card = cards.snapshotItem(i);
+    var link = first("%s", card);
+    if (!link || !link.getAttribute("href")) { rows.push(null); continue; }
+    var img = first("%s", card);
+    rows.push([link.innerText.trim(), link.href.trim(), img ? img.src.trim() : "%s"]);
+}
+return {count: cards.snapshotLength, rows: rows};
+""" % (CARD_XPATH, LINK_XPATH, IMG_XPATH, NO_IMAGE)
+
+
+def extract_page_data(driver, category_name, start=0):
+    """Extrait les services (Listing) à partir de la carte `start` ; retourne (lignes, nb de cartes)."""
+    result = driver.execute_script(EXTRACT_CARDS_JS, start)
+    extracted_rows = [Listing(category_name, *card) for card in result["rows"] if card]
+    return extracted_rows, result["count"]
+
+
+def _html_from_response(response):
+    """Le bouton 'Voir plus' peut renvoyer du HTML brut ou un JSON contenant le fragment."""
+    if "json" not in response.headers.get("Content-Type", ""):
+        return response.content
+    try:
+        payload = response.json()
+    except ValueError:
+        return response.content
+    if isinstance(payload, dict):
+        for key in ("html", "content", "data", "services"):
+            if isinstance(payload.get(key), str):
+                return payload[key]
+        for value in payload.values():
+            if isinstance(value, str) and "<" in value:
+                return value
+    return ""
+
+
+def parse_tree(content):
+    """Parse une page complète ou un fragment ; None si le contenu est vide."""
+    if not content or not content.strip():
+        return None
+    try:
+        return lxml_html.document_fromstring(content)
+    except (etree.ParserError, ValueError):
+        return None
+
+
+def parse_cards(tree, category_name, base_url):
+    """Extrait les Listing (catégorie, titre, lien, image) des cartes de services."""
+    rows = []
+    if tree is None:
+        return rows
+    for card in tree.xpath(CARD_XPATH):
+        links = card.xpath(LINK_XPATH)
+        if not links or not links[0].get("href"):
+            continue
+        link_elem = links[0]
+        title = link_elem.text_content().strip()
+        link = urljoin(base_url, link_elem.get("href").strip())
+
+        imgs = card.xpath(IMG_XPATH)
+        img_src = imgs[0].get("src") if imgs else None
+        img_src = urljoin(base_url, img_src.strip()) if img_src else NO_IMAGE
+
+        rows.append(Listing(category_name, title, link, img_src))
+    return rows
+
+
+def pagination_from_button(tree, page_url):
+    """Déduit l'endpoint paginé à partir des attributs du bouton 'Voir plus'.
+
+    Retourne (url, paramètre, première valeur, bouton présent) ; à défaut
+    d'endpoint dans le bouton, ?page=2 sur la page de la catégorie.
+    """
+    buttons = tree.xpath(LOAD_MORE_XPATH) if tree is not None else []
+    endpoint, param, value = page_url, "page", 2
+    if buttons:
+        attrs = buttons[0].attrib
+        for name in ("data-url", "data-href", "data-action", "href"):
+            candidate = attrs.get(name, "").strip()
+            if candidate and not candidate.startswith(("#", "javascript")):
+                endpoint = urljoin(page_url, candidate)
+                break
+        if attrs.get("data-offset", "").isdigit():
+            param, value = "offset", int(attrs["data-offset"])
+        elif attrs.get("data-page", "").isdigit():
+            value = int(attrs["data-page"])
+    return endpoint, param, value, bool(buttons)
+
+
+def parse_listing_page(content, category_name, base_url, page_url=None):
+    """Lignes d'une page de listing et, avec `page_url`, sa pagination.
+
+    Ne renvoie que des valeurs picklables : exécutable dans un ParsePool.
+    """
+    tree = parse_tree(content)
+    rows = parse_cards(tree, category_name, base_url)
+    if page_url is None:
+        return rows, None
+    return rows, pagination_from_button(tree, page_url)
+
+
+def with_query(url, **params):
+    parsed = urlparse(url)
+    query = dict(parse_qsl(parsed.query))
+    query.update({key: str(value) for key, value in params.items()})
+    return urlunparse(parsed._replace(query=urlencode(query)))
+
+
+def crawl_listing(session, cat_url, category_name, limiter=None, log=None, cache=None, parser=None):
+    """Parcourt une sous-catégorie page par page via l'endpoint de pagination.
+
+    Génère les lignes de chaque page dès sa réception ; s'arrête sur une page
+    vide ou qui n'apporte aucun nouveau lien. Retourne None (au lieu d'un
+    générateur vide) si la première page est inexploitable en HTTP. L'échec
+    d'une page suivante lève FetchError : un listing tronqué ne doit pas
+    passer pour complet (seul un 404 marque la fin de la pagination). De
+    même si la page annonce une suite ('Voir plus') et que la page 2 n'apporte
+    aucun nouveau lien : l'endpoint deviné ignore alors sa pagination (page 1
+    renvoyée à nouveau, par exemple).
+
+    Le parsing passe par `parser` (ParsePool) : avec une pagination par
+    numéro de page, la page suivante est téléchargée pendant le parsing de
+    la courante.
+    """
+    parser = parser or INLINE
+    response = fetch(session, cat_url, limiter, cache=cache)
+    if response is None:
+        return None
+    first_rows, pagination = parser.run(parse_listing_page, response.content, category_name, cat_url, cat_url,
+                                        page="listing")
+    if not first_rows:
+        return None
+
+    def pages():
+        seen = {row[2] for row in first_rows}
+        yield first_rows
+
+        endpoint, param, value, more = pagination
+        # Avec un offset, la requête suivante dépend du nombre de cartes parsées
+        lookahead = 2 if param == "page" and parser is not INLINE else 1
+        in_flight = deque()
+        page_number = 2
+        exhausted = False
+        while True:
+            while not exhausted and page_number <= MAX_PAGES and len(in_flight) < lookahead:
+                page_url = with_query(endpoint, **{param: value})
+                try:
+                    page_response = fetch(session, page_url, limiter, cache=cache, raise_errors=True)
+                except FetchError as e:
+                    # 404 : fin de la pagination, sauf sur la suite annoncée par le bouton
+                    if e.reason != "http_404" or (page_number == 2 and more):
+                        raise
+                    exhausted = True
+                    break
+                in_flight.append((page_number, page_url, parser.submit(
+                    parse_listing_page, _html_from_response(page_response), category_name, cat_url,
+                    page="listing")))
+                page_number += 1
+                if param == "page":
+                    value += 1
+            if not in_flight:
+                break
+            number, page_url, future = in_flight.popleft()
+            rows, _ = future.result()
+            new_rows = [row for row in rows if row[2] not in seen]
+            if not new_rows:
+                if number == 2 and more:
+                    raise FetchError(page_url, "pagination_stalled")
+                break
+            seen.update(row[2] for row in new_rows)
+            if log:
+                log(f"   ⏳ Page {number} : {len(new_rows)} services")
+            yield new_rows
+            if param == "offset":
+                value += len(rows)
+
+    return pages()
@@ -0,0 +1,111 @@
+"""Fusionne les sorties des shards (categories/shards/shard_i_of_N) dans le stockage principal.
+
+Usage : python merge_shards.py [--replace-listings] [--clean]
+
+Les listings sont ajoutés (dédoublonnés par catégorie et lien), les détails
+upsertés par lien et les appartenances ajoutées, puis les statistiques
+(stats.py) régénérées. Pour chaque source traitée par un shard, les lignes
+de détails du principal qui lui appartiennent mais qu'il n'a plus (services
+retirés du listing, erreurs) sont supprimées, comme en mode non shardé. --replace-listings remplace chaque listing par
+l'union des shards (après un rafraîchissement complet de tous les
+shards) ; --clean supprime les dossiers des shards fusionnés.
+"""
+import os
+import shutil
+import sys
+from itertools import islice
+
+from shard import Shard, shard_directories
+from stats import build_reports
+from storage import DETAILS_LINK, open_storage
+from url_classifier import canonical_url, load_classifier
+
+BATCH = 500
+
+
+def batches(rows, size=BATCH):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def open_shard(directory):
+    return open_storage(directory, db_path=os.path.join(directory, "khamsat.db"))
+
+
+def merge_shards(base_dir, replace_listings=False, clean=False):
+    """Fusionne tous les shards présents ; retourne le nombre de lignes par type."""
+    directories = shard_directories(base_dir)
+    if not directories:
+        print(f"❌ Aucun shard dans {os.path.join(base_dir, 'shards')}")
+        return None
+
+    main = open_storage(base_dir)
+    counts = {"listings": 0, "details": 0, "details_removed": 0, "membership": 0}
+    # Même clé de partage que rac4.py
+    classifier = load_classifier(base_dir)
+    service_key = classifier.service_key if classifier else canonical_url
+    try:
+        # Listings (rac3), éventuellement reconstruits dans une source temporaire
+        replaced = set()
+        for directory in directories:
+            local = open_shard(directory)
+            try:
+                for source in local.listing_sources():
+                    target = f".merge_{source}" if replace_listings else source
+                    replaced.add(source)
+                    for batch in batches(local.iter_listings(source)):
+                        counts["listings"] += main.write_listings(target, batch)
+            finally:
+                local.close()
+        if replace_listings:
+            for source in sorted(replaced):
+                main.promote_listings(f".merge_{source}", source)
+        main.flush()
+
+        # Détails et appartenances (rac4)
+        sources = main.listing_sources()
+        for directory in directories:
+            shard = Shard.from_directory(directory)
+            local = open_shard(directory)
+            try:
+                for source in sources:
+                    local_links = {row[DETAILS_LINK] for row in local.iter_details(source)}
+                    if not local_links:
+                        # Source que le shard n'a pas traitée : le principal reste tel quel
+                        continue
+                    stale = {row[DETAILS_LINK] for row in main.iter_details(source)
+                             if row[DETAILS_LINK] not in local_links and shard.owns(service_key(row[DETAILS_LINK]))}
+                    counts["details_removed"] += main.delete_details(source, stale)
+                    for batch in batches(local.iter_details(source)):
+                        main.write_details(source, batch)
+                        counts["details"] += len(batch)
+                for batch in batches(local.iter_membership()):
+                    main.write_membership(batch)
+                    counts["membership"] += len(batch)
+            finally:
+                local.close()
+            print(f"✅ {os.path.basename(directory)} fusionné")
+        main.flush()
+        # Statistiques sur les détails fusionnés
+        build_reports(main, base_dir)
+    finally:
+        main.close()
+
+    if clean:
+        for directory in directories:
+            shutil.rmtree(directory)
+        print(f"🧹 {len(directories)} dossiers de shards supprimés")
+    return counts
+
+
+if __name__ == "__main__":
+    base_dir = os.path.join(os.getcwd(), "categories")
+    counts = merge_shards(base_dir, "--replace-listings" in sys.argv, "--clean" in sys.argv)
+    if counts is None:
+        sys.exit(1)
+    print(f"📊 {counts['listings']} lignes de listing ajoutées, {counts['details']} lignes de détails "
+          f"({counts['details_removed']} retirées), {counts['membership']} appartenances")
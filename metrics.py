@@ -0,0 +1,217 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from fsutils import atomic_open
+
+# Bornes (secondes) des histogrammes de latence
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Histogramme à seaux fixes (cumulés à l'export, comme Prometheus)."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Borne haute du seau contenant le quantile `q` (estimation)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": round(self.max, 6),
+        }
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _labels_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Metrics:
+    """Compteurs, jauges et histogrammes partagés par les scripts (thread-safe).
+
+    `start()` lance l'export périodique (textfile Prometheus réécrit, ou une
+    ligne JSON ajoutée par intervalle) ; `stop()` écrit le résumé de fin de run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.job = None
+        self.started = time.time()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.path = None
+        self.fmt = None
+        self.summary_path = None
+
+    # --- enregistrement ---
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def total(self, name, **labels):
+        """Somme d'un compteur sur toutes les séries dont les labels correspondent."""
+        wanted = {(k, str(v)) for k, v in labels.items()}
+        with self._lock:
+            return sum(value for (metric, series), value in self.counters.items()
+                       if metric == name and wanted <= set(series))
+
+    # --- export ---
+    def snapshot(self):
+        with self._lock:
+            return {
+                "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "job": self.job,
+                "uptime_s": round(time.time() - self.started, 1),
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in sorted(self.counters.items())],
+                "gauges": [{"name": name, "labels": dict(labels), "value": value}
+                           for (name, labels), value in sorted(self.gauges.items())],
+                "histograms": [{"name": name, "labels": dict(labels), **histogram.as_dict()}
+                               for (name, labels), histogram in sorted(self.histograms.items())],
+            }
+
+    def prometheus(self):
+        """Format texte Prometheus (collecteur textfile de node_exporter)."""
+        lines = []
+        job = (("job", self.job),) if self.job else ()
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"khamsat_{name}{_labels_text(labels, job)} {value}")
+            for (name, labels), value in sorted(self.gauges.items()):
+                lines.append(f"khamsat_{name}{_labels_text(labels, job)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f"khamsat_{name}_bucket{_labels_text(labels, job + (('le', bound),))} {cumulative}")
+                lines.append(f"khamsat_{name}_sum{_labels_text(labels, job)} {histogram.sum}")
+                lines.append(f"khamsat_{name}_count{_labels_text(labels, job)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        if not self.path:
+            return
+        if self.fmt == "jsonl":
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.snapshot(), ensure_ascii=False) + "\n")
+        else:
+            with atomic_open(self.path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus())
+
+    def _run(self, interval):
+        while not self._stop_event.wait(interval):
+            try:
+                self.write()
+            except OSError:
+                pass
+
+    def start(self, job, directory):
+        """Démarre l'export périodique, configuré par les variables KHAMSAT_METRICS_*."""
+        self.job = job
+        self.started = time.time()
+        self.fmt = os.environ.get("KHAMSAT_METRICS_FORMAT", "prometheus")
+        interval = float(os.environ.get("KHAMSAT_METRICS_INTERVAL", "30"))
+        os.makedirs(directory, exist_ok=True)
+        suffix = "jsonl" if self.fmt == "jsonl" else "prom"
+        self.path = os.environ.get("KHAMSAT_METRICS_FILE", os.path.join(directory, f"{job}.{suffix}"))
+        self.summary_path = os.path.join(directory, f"summary_{job}.json")
+        if interval > 0:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+            self._thread.start()
+
+    def summary(self, extra=None):
+        """Résumé de fin de run : durée, débits, compteurs et histogrammes."""
+        snapshot = self.snapshot()
+        duration = time.time() - self.started
+        services = self.total("services_total")
+        summary = {
+            "job": self.job,
+            "started_at": datetime.fromtimestamp(self.started, timezone.utc).isoformat(timespec="seconds"),
+            "finished_at": snapshot["time"],
+            "duration_s": round(duration, 1),
+            "services_per_sec": round(services / duration, 3) if duration else 0.0,
+            "counters": snapshot["counters"],
+            "histograms": snapshot["histograms"],
+        }
+        summary.update(extra or {})
+        return summary
+
+    def stop(self, extra=None):
+        """Arrête l'export, écrit un dernier point et le résumé ; retourne ce dernier."""
+        if self._thread:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+        self.write()
+        summary = self.summary(extra)
+        if self.summary_path:
+            with atomic_open(self.summary_path, "w", encoding="utf-8") as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+        return summary
+
+
+# Registre commun du processus (comme le module logging)
+metrics = Metrics()
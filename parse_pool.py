@@ -0,0 +1,122 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import metrics
+
+
+def _warm_up():
+    return None
+
+
+def _timed(func, *args):
+    """Exécuté dans le worker : résultat et durée du parsing, mesurée là où il a lieu."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+class ParsePool:
+    """Parsing HTML (lxml, lié au CPU) dans un pool de processus, hors des threads réseau.
+
+    Les threads de téléchargement soumettent le contenu brut et attendent le
+    résultat sans garder le GIL. Au plus `max_pending` contenus attendent leur
+    parsing : au-delà, `submit` bloque le thread qui télécharge (contre-pression).
+    Avec 0 worker (défaut), ou sans fork (Windows, macOS), le parsing reste
+    dans le thread appelant. La durée de chaque parsing revient du worker avec
+    son résultat et est publiée (parse_seconds) par le processus principal.
+    """
+
+    def __init__(self, workers=0, max_pending=None):
+        if "fork" not in multiprocessing.get_all_start_methods():
+            workers = 0
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending or max(workers, 1) * 2)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._executor = None
+        if workers > 0:
+            # fork plutôt que spawn : les scripts s'exécutent à l'import et ne
+            # doivent pas être relancés dans les workers. Les processus sont
+            # créés ici, avant les threads réseau et d'export des métriques.
+            self._executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork"))
+            self._executor.submit(_warm_up).result()
+
+    @classmethod
+    def from_env(cls):
+        """Pool dimensionné par KHAMSAT_PARSE_WORKERS (défaut 0 : sans pool).
+
+        À ~2 requêtes/s par hôte, le parsing n'est pas le goulot : le pool est
+        à activer seulement si le profil montre le contraire.
+        """
+        return cls(int(os.environ.get("KHAMSAT_PARSE_WORKERS", "0")))
+
+    def _track(self, delta):
+        with self._lock:
+            self._pending += delta
+            metrics.set("queue_depth", self._pending, pool="parse")
+
+    def submit(self, func, *args, page="page"):
+        """Lance `func(*args)` (fonction de module, arguments picklables) ; retourne un Future."""
+        future = Future()
+        if self._executor is None:
+            try:
+                future.set_result(self._inline(func, *args, page=page))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        self._slots.acquire()
+        self._track(1)
+        start = time.perf_counter()
+
+        def done(work):
+            self._slots.release()
+            self._track(-1)
+            metrics.observe("parse_pool_seconds", time.perf_counter() - start, page=page)
+            if work.cancelled():
+                future.cancel()
+            elif work.exception() is not None:
+                future.set_exception(work.exception())
+            else:
+                result, seconds = work.result()
+                metrics.observe("parse_seconds", seconds, page=page)
+                future.set_result(result)
+
+        try:
+            work = self._executor.submit(_timed, func, *args)
+        except (BrokenProcessPool, RuntimeError):
+            # Pool cassé (worker tué) ou fermé : on continue dans le thread
+            self._slots.release()
+            self._track(-1)
+            self._executor = None
+            return self.submit(func, *args, page=page)
+        work.add_done_callback(done)
+        return future
+
+    @staticmethod
+    def _inline(func, *args, page="page"):
+        result, seconds = _timed(func, *args)
+        metrics.observe("parse_seconds", seconds, page=page)
+        return result
+
+    def run(self, func, *args, page="page"):
+        """Comme `submit`, mais attend et retourne le résultat."""
+        future = self.submit(func, *args, page=page)
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            self._executor = None
+            return self._inline(func, *args, page=page)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+# Parsing dans le thread appelant, pour les appels sans pool
+INLINE = ParsePool(0)
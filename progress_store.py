@@ -0,0 +1,252 @@
+import array
+import bisect
+import hashlib
+import heapq
+import json
+import mmap
+import os
+import time
+
+from fsutils import atomic_open
+
+# Le snapshot garde le format historique (liste JSON) ; chaque URL terminée
+# est ajoutée au journal, une ligne par URL, au lieu de réécrire le snapshot.
+SNAPSHOT_SUFFIX = ".json"
+JOURNAL_SUFFIX = ".journal"
+# Snapshot de ProgressIndex : empreintes 64 bits triées (uint64, ordre natif)
+INDEX_SUFFIX = ".idx"
+
+
+def progress_paths(directory, name):
+    base = os.path.join(directory, f"progress_{name}")
+    return base + SNAPSHOT_SUFFIX, base + JOURNAL_SUFFIX
+
+
+def index_path(directory, name):
+    return os.path.join(directory, f"progress_{name}{INDEX_SUFFIX}")
+
+
+def url_digest(url):
+    """Empreinte 64 bits (blake2b) d'une URL."""
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _read_journal(journal_path):
+    """Retourne (entrées, taille valide) ; une dernière ligne incomplète est ignorée."""
+    if not os.path.exists(journal_path):
+        return [], 0
+    with open(journal_path, "rb") as f:
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    lines = data[:end].decode("utf-8").split("\n")
+    return [line for line in lines if line], end
+
+
+def load_entries(directory, name):
+    """Charge snapshot + journal sans ouvrir le journal en écriture."""
+    snapshot_path, journal_path = progress_paths(directory, name)
+    entries = set()
+    if os.path.exists(snapshot_path):
+        with open(snapshot_path, "r", encoding="utf-8") as f:
+            entries.update(json.load(f))
+    entries.update(_read_journal(journal_path)[0])
+    return entries
+
+
+class ProgressStore:
+    """Ensemble d'URLs traitées, persisté en append-only avec compaction périodique."""
+
+    def __init__(self, directory, name, sync_every=50, sync_interval=5.0, compact_every=5000):
+        self.directory = directory
+        self.name = name
+        self.snapshot_path, self.journal_path = progress_paths(directory, name)
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.compact_every = compact_every
+
+        self._load_snapshot()
+
+        journal, valid_size = _read_journal(self.journal_path)
+        for entry in journal:
+            self._remember(entry)
+        self._journal_count = len(journal)
+
+        # Coupe une éventuelle ligne tronquée par un arrêt brutal
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) != valid_size:
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(valid_size)
+
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def _load_snapshot(self):
+        self._items = set()
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                self._items.update(json.load(f))
+
+    def _remember(self, url):
+        self._items.add(url)
+
+    def _write_snapshot(self):
+        with atomic_open(self.snapshot_path, "w", encoding="utf-8") as f:
+            json.dump(list(self._items), f, ensure_ascii=False)
+
+    def __contains__(self, url):
+        return url in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def add(self, url):
+        if url in self:
+            return
+        self._remember(url)
+        self._journal.write(url + "\n")
+        self._journal_count += 1
+        self._pending += 1
+
+        if self._pending >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+            self.sync()
+        if self._journal_count >= self.compact_every:
+            self.compact()
+
+    def sync(self):
+        """Force l'écriture du journal sur disque (fsync)."""
+        if self._pending:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def compact(self):
+        """Réécrit le snapshot complet puis vide le journal."""
+        self.sync()
+        self._write_snapshot()
+        # Si on s'arrête ici, le journal ne contient que des doublons du snapshot
+        self._journal.close()
+        self._journal = open(self.journal_path, "w", encoding="utf-8")
+        self._journal_count = 0
+
+    def replace(self, items):
+        """Remplace tout le contenu (snapshot réécrit, journal vidé)."""
+        self._items = set(items)
+        self._pending = 0
+        self.compact()
+
+    def close(self):
+        if self._journal.closed:
+            return
+        if self._journal_count:
+            self.compact()
+        else:
+            self.sync()
+        self._journal.close()
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) == 0:
+            os.remove(self.journal_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ProgressIndex(ProgressStore):
+    """Variante compacte de ProgressStore pour les gros volumes d'URLs.
+
+    Le snapshot est un fichier trié d'empreintes 64 bits, mappé en mémoire et
+    interrogé par dichotomie ; seules les empreintes ajoutées depuis la
+    dernière compaction restent dans un set. La mémoire ne dépend donc pas du
+    nombre d'URLs déjà traitées. Un ancien progress_*.json est converti au
+    premier chargement.
+
+    Les URLs elles-mêmes ne sont pas conservées : l'itération renvoie les
+    empreintes (url_digest), pas les entrées. Un store dont on relit les
+    entrées (services vérifiés, voir refresh.parse_verified) reste un
+    ProgressStore.
+    """
+
+    def __init__(self, directory, name, **kwargs):
+        super().__init__(directory, name, **kwargs)
+        if self._legacy:
+            self.compact()
+            os.remove(self.snapshot_path)
+
+    def _load_snapshot(self):
+        self.index_path = index_path(self.directory, self.name)
+        self._new = set()
+        self._open_index()
+
+        # Migration de l'ancien snapshot JSON
+        self._legacy = os.path.exists(self.snapshot_path)
+        if self._legacy:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                for url in json.load(f):
+                    self._remember(url)
+
+    def _open_index(self):
+        self._file = self._map = None
+        self._view = memoryview(b"").cast("Q")
+        if os.path.exists(self.index_path) and os.path.getsize(self.index_path):
+            self._file = open(self.index_path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._map).cast("Q")
+
+    def _close_index(self):
+        self._view.release()
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+        self._file = self._map = None
+
+    def _in_snapshot(self, digest):
+        i = bisect.bisect_left(self._view, digest)
+        return i < len(self._view) and self._view[i] == digest
+
+    def _remember(self, url):
+        digest = url_digest(url)
+        if not self._in_snapshot(digest):
+            self._new.add(digest)
+
+    def __contains__(self, url):
+        digest = url_digest(url)
+        return digest in self._new or self._in_snapshot(digest)
+
+    def __len__(self):
+        return len(self._view) + len(self._new)
+
+    def __iter__(self):
+        """Parcourt les empreintes (les URLs ne sont pas conservées)."""
+        return heapq.merge(iter(self._view), sorted(self._new))
+
+    def _write_snapshot(self, chunk=65536):
+        # Fusion en flux du snapshot trié et des nouvelles empreintes
+        merged = heapq.merge(iter(self._view), sorted(self._new))
+        with atomic_open(self.index_path, "wb") as f:
+            buffer = array.array("Q")
+            for digest in merged:
+                buffer.append(digest)
+                if len(buffer) >= chunk:
+                    buffer.tofile(f)
+                    buffer = array.array("Q")
+            buffer.tofile(f)
+        self._close_index()
+        self._new = set()
+        self._open_index()
+
+    def replace(self, items):
+        """Remplace tout le contenu (index réécrit à partir des URLs, journal vidé)."""
+        self._close_index()
+        self._view = memoryview(b"").cast("Q")
+        self._new = {url_digest(item) for item in items}
+        self._pending = 0
+        self.compact()
+
+    def close(self):
+        super().close()
+        self._close_index()
@@ -1,11 +1,16 @@
-import requests
-from bs4 import BeautifulSoup
 import csv
 import os
-import time
 import logging
 import re
-from urllib.parse import urlparse
+
+from fetch_pool import ordered_map
+from fsutils import atomic_open
+from http_cache import cache_from_env
+from http_client import make_session, fetch
+from metrics import metrics
+from rate_limit import HostRateLimiter
+from records import Category
+from url_classifier import UrlClassifier
 
 # ==========================================
 # 1. CONFIGURATION - ADAPTÉ POUR GITHUB ACTIONS
@@ -39,6 +44,16 @@ log_file = os.path.join(base_path, "journal_sous_categories.log")
 if not os.path.exists(output_dir):
     os.makedirs(output_dir)
 
+# Découverte concurrente : pages en vol, débit initial (requêtes/s) et
+# profondeur max sous la catégorie principale (1 = sous-catégories directes)
+DISCOVERY_WORKERS = int(os.environ.get("KHAMSAT_DISCOVERY_WORKERS", "8"))
+RATE_PER_HOST = float(os.environ.get("KHAMSAT_RATE_PER_HOST", "2"))
+MAX_DEPTH = int(os.environ.get("KHAMSAT_MAX_DEPTH", "3"))
+
+# Colonnes des fichiers sous_categories ; rac3 ne lit que les deux premières
+# et ignore les lignes qui ne sont pas des feuilles de l'arbre
+OUTPUT_HEADER = ["Nom sous-catégorie", "Lien", "Parent", "Profondeur", "Feuille"]
+
 # Configuration du Logging
 logging.basicConfig(
     filename=log_file,
@@ -77,73 +92,123 @@ except Exception as e:
 log_print(f"{len(categories_todo)} catégories principales chargées. Début du traitement...")
 log_print("-" * 40)
 
-headers = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
-}
+# Regex unique compilée depuis les catégories principales
+classifier = UrlClassifier(cat['url'] for cat in categories_todo)
+
+metrics.start("rac2", os.path.join(base_path, "metrics"))
+session = make_session(DISCOVERY_WORKERS)
+# Débit adaptatif, repris du dernier run (.cache/throttle_state.json)
+limiter = HostRateLimiter.from_env(RATE_PER_HOST)
+cache = cache_from_env()
 
 # ==========================================
-# 3. BOUCLE DE TRAITEMENT
+# 3. DÉCOUVERTE DE L'ARBRE DES CATÉGORIES
 # ==========================================
 
-total_subs_extracted = 0
-
-for i, cat in enumerate(categories_todo):
-    cat_name = cat['name']
-    cat_url = cat['url']
-    
+def output_path(cat_name):
     safe_name = re.sub(r'[\\/*?:"<>|]', "", cat_name)
     safe_name = safe_name.replace(" ", "_")
-    output_csv = os.path.join(output_dir, f"{safe_name}.csv")
-    
-    log_print(f"[{i+1}/{len(categories_todo)}] Traitement : {cat_name}...")
-
-    try:
-        response = requests.get(cat_url, headers=headers)
-        if response.status_code != 200:
-            log_print(f"   -> Erreur HTTP {response.status_code}", "error")
-            continue
+    return os.path.join(output_dir, f"{safe_name}.csv")
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        subcategories = []
-        seen_links = set()
-
-        parsed_cat_url = urlparse(cat_url)
-        cat_path = parsed_cat_url.path
-        
-        all_links = soup.find_all('a', href=True)
-        
-        for link in all_links:
-            href = link['href']
-            text = link.get_text(strip=True)
-            
-            if not href.startswith('http'):
-                href = "https://khamsat.com" + href
-                
-            if (href.startswith(cat_url) or (cat_path in href and "khamsat.com" in href)):
-                if href != cat_url and "/service/" not in href and "/user/" not in href:
-                    if "?" not in href and text and len(text) > 2:
-                        if href not in seen_links:
-                            subcategories.append([text, href])
-                            seen_links.add(href)
-
-        if subcategories:
-            with open(output_csv, mode='w', newline='', encoding='utf-8-sig') as f:
+
+def is_current(path):
+    """Le CSV existe déjà au format arborescent (sinon il faut redescendre l'arbre)."""
+    if not os.path.exists(path):
+        return False
+    with open(path, "r", encoding="utf-8-sig") as f:
+        return next(csv.reader(f), []) == OUTPUT_HEADER
+
+
+def discover(node):
+    """Télécharge une page de l'arbre ; renvoie None (erreur), "unchanged" ou ses enfants."""
+    response = fetch(session, node["url"], limiter, cache=cache)
+    if response is None:
+        return None
+    if node["depth"] == 0 and getattr(response, "unchanged", False) and is_current(node["output"]):
+        return "unchanged"
+    return classifier.subcategories(response.content, node["url"])
+
+
+total_subs_extracted = 0
+trees = {}
+
+# Parcours en largeur : chaque niveau de l'arbre est téléchargé en parallèle
+level = []
+for cat in categories_todo:
+    output_csv = output_path(cat['name'])
+    trees[cat['url']] = {"name": cat['name'], "output": output_csv, "rows": [], "seen": {cat['url']}, "ok": True}
+    level.append({"root": cat['url'], "name": cat['name'], "url": cat['url'], "depth": 0, "output": output_csv})
+
+try:
+    while level:
+        depth = level[0]["depth"]
+        log_print(f"Niveau {depth} : {len(level)} pages à parcourir")
+        next_level = []
+        for node, children, error in ordered_map(discover, level, DISCOVERY_WORKERS, name="discovery"):
+            if error is not None:
+                log_print(f"   -> {error.__class__.__name__} sur {node['url']} : {error}", "error")
+            tree = trees[node["root"]]
+            metrics.inc("pages_total", depth=depth, status="error" if children is None else "ok")
+            if children is None:
+                log_print(f"   -> Erreur HTTP sur {node['url']}", "error")
+                # Arbre incomplet : l'ancien CSV reste en place
+                tree["ok"] = False
+                continue
+            if children == "unchanged":
+                log_print(f"   -> Inchangé, {os.path.basename(tree['output'])} conservé")
+                tree["ok"] = False
+                tree["unchanged"] = True
+                continue
+
+            parent = node.get("category")
+            new_children = [(text, href) for text, href in children if href not in tree["seen"]]
+            if parent is not None:
+                parent.leaf = not new_children
+            for text, href in new_children:
+                tree["seen"].add(href)
+                category = Category(text, href, node["name"], depth + 1)
+                tree["rows"].append(category)
+                if depth + 1 < MAX_DEPTH:
+                    next_level.append({"root": node["root"], "name": text, "url": href,
+                                       "depth": depth + 1, "category": category})
+        level = next_level
+
+    # ==========================================
+    # 4. ÉCRITURE DES FICHIERS
+    # ==========================================
+
+    for i, tree in enumerate(trees.values()):
+        cat_name = tree["name"]
+        log_print(f"[{i+1}/{len(trees)}] {cat_name}")
+        if tree.get("unchanged"):
+            continue
+        if not tree["ok"]:
+            log_print(f"   -> Arbre incomplet, {os.path.basename(tree['output'])} non modifié", "warning")
+            continue
+        if tree["rows"]:
+            with atomic_open(tree["output"], "w", newline='', encoding='utf-8-sig') as f:
                 writer = csv.writer(f)
-                writer.writerow(["Nom sous-catégorie", "Lien"])
-                writer.writerows(subcategories)
+                writer.writerow(OUTPUT_HEADER)
+                writer.writerows(category.as_row() for category in tree["rows"])
             
-            count = len(subcategories)
+            count = len(tree["rows"])
             total_subs_extracted += count
-            log_print(f"   -> Succès : {count} sous-catégories sauvegardées dans {safe_name}.csv")
+            leaves = sum(1 for category in tree["rows"] if category.leaf)
+            log_print(f"   -> Succès : {count} sous-catégories ({leaves} feuilles) sauvegardées dans {os.path.basename(tree['output'])}")
         else:
             log_print(f"   -> ATTENTION : Aucune sous-catégorie trouvée pour {cat_name}", "warning")
 
-        time.sleep(2)
+except Exception as e:
+    log_print(f"   -> Exception critique : {e}", "error")
 
-    except Exception as e:
-        log_print(f"   -> Exception critique : {e}", "error")
+finally:
+    session.close()
+    limiter.save()
+    if cache:
+        cache.prune()
 
 log_print("-" * 40)
 log_print(f"=== FIN DU TRAITEMENT ===")
 log_print(f"Total sous-catégories extraites : {total_subs_extracted}")
-log_print(f"Consultez le dossier : {output_dir}")
\ No newline at end of file
+metrics.stop({"subcategories": total_subs_extracted})
+log_print(f"Consultez le dossier : {output_dir}")
@@ -2,16 +2,27 @@ import csv
 import time
 import os
 import sys
-import json
 import logging
 import glob
-from selenium import webdriver
+from datetime import datetime, timezone
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 
+from browser import init_driver, record_page, traffic_summary
+from browser_pool import BrowserPool
+from fetch_pool import ordered_map
+from http_cache import cache_from_env
+from http_client import make_session
+from listing_crawler import CARD_XPATH, LOAD_MORE_XPATH, crawl_listing, extract_page_data
+from metrics import metrics
+from parse_pool import ParsePool
+from progress_store import ProgressIndex, index_path, progress_paths
+from rate_limit import HostRateLimiter, browser_class
+from shard import Shard
+from url_classifier import SERVICE, canonical_url, load_classifier
+
 # ==========================================
 # 1. CONFIGURATION POUR GITHUB ACTIONS
 # ==========================================
@@ -19,8 +30,30 @@ from selenium.common.exceptions import TimeoutException, NoSuchElementException
 # Dossier de base (relatif, fonctionne sur Windows ET Linux)
 base_dir = os.path.join(os.getcwd(), "categories")
 sous_cat_dir = os.path.join(base_dir, "sous_categories")
-resultats_dir = os.path.join(base_dir, "resultats")
-progress_dir = os.path.join(base_dir, "progress")
+
+# Mode shard (--shard i/N ou KHAMSAT_SHARD) : chaque processus ne traite que
+# ses sous-catégories et écrit sous categories/shards/ (fusion par merge_shards.py)
+shard = Shard.from_argv()
+work_dir = shard.directory(base_dir)
+resultats_dir = os.path.join(work_dir, "resultats")
+progress_dir = os.path.join(work_dir, "progress")
+metrics_dir = os.path.join(work_dir, "metrics")
+
+# Pool de navigateurs : nombre de Chrome en parallèle et seuils de recyclage
+BROWSER_WORKERS = int(os.environ.get("KHAMSAT_BROWSERS", os.cpu_count() or 1))
+BROWSER_MAX_PAGES = int(os.environ.get("KHAMSAT_BROWSER_MAX_PAGES", "25"))
+BROWSER_MAX_RSS_MB = int(os.environ.get("KHAMSAT_BROWSER_MAX_RSS_MB", "1500"))
+
+# Listing : "http" (pagination directe, Selenium en secours) ou "browser"
+LISTING_MODE = os.environ.get("KHAMSAT_LISTING_MODE", "http")
+LISTING_WORKERS = int(os.environ.get("KHAMSAT_LISTING_WORKERS", "4"))
+RATE_PER_HOST = float(os.environ.get("KHAMSAT_RATE_PER_HOST", "2"))
+
+# Rafraîchissement mensuel : reconstruit les Resultats_*.csv depuis zéro
+REFRESH = os.environ.get("KHAMSAT_REFRESH", "0") == "1"
+# Un rafraîchissement par mois : chaque listing promu pose son marqueur, et
+# refreshed_<mois>.done marque le mois terminé (le workflow saute alors l'étape)
+REFRESH_MONTH = datetime.now(timezone.utc).strftime("%Y-%m")
 
 # Création des dossiers nécessaires
 for directory in [resultats_dir, progress_dir]:
@@ -28,7 +61,7 @@ for directory in [resultats_dir, progress_dir]:
         os.makedirs(directory)
 
 # Log principal
-log_file = os.path.join(base_dir, "journal_scraping_services.log")
+log_file = os.path.join(work_dir, "journal_scraping_services.log")
 
 # Configuration du Logging
 logging.basicConfig(
@@ -53,6 +86,8 @@ def log_print(msg, level="info"):
 
 log_print("=" * 50)
 log_print("🚀 DÉMARRAGE DU SCRAPER DE SERVICES KHAMSAT")
+if shard.enabled:
+    log_print(f"🧩 Shard {shard} : {work_dir}")
 log_print("=" * 50)
 
 # ==========================================
@@ -68,191 +103,279 @@ if not csv_files:
 
 log_print(f"📂 {len(csv_files)} fichiers CSV trouvés à traiter")
 
+# Classifieur d'URLs : seuls les liens de services sont enregistrés
+classifier = load_classifier(base_dir)
+
 # ==========================================
 # 3. GESTION DE LA PROGRESSION
 # ==========================================
 def load_progress(filename):
-    progress_file = os.path.join(progress_dir, f"progress_{filename}.json")
-    if os.path.exists(progress_file):
-        with open(progress_file, 'r', encoding='utf-8') as f:
-            return set(json.load(f))
-    return set()
+    """Ouvre l'index de progression (convertit les anciens progress_*.json)."""
+    return ProgressIndex(progress_dir, filename)
+
+
+def refresh_marker(input_filename=None):
+    """Marqueur du rafraîchissement du mois : d'un fichier, ou du mois entier sans argument."""
+    suffix = f"_{input_filename}" if input_filename else ""
+    return os.path.join(progress_dir, f"refreshed_{REFRESH_MONTH}{suffix}.done")
+
 
-def save_progress(filename, processed_set):
-    progress_file = os.path.join(progress_dir, f"progress_{filename}.json")
-    with open(progress_file, 'w', encoding='utf-8') as f:
-        json.dump(list(processed_set), f, ensure_ascii=False)
+def touch(path):
+    with open(path, "w", encoding="utf-8"):
+        pass
+
+
+if REFRESH:
+    # Les marqueurs des mois précédents n'ont plus cours
+    for path in glob.glob(os.path.join(glob.escape(progress_dir), "refreshed_*.done")):
+        if not os.path.basename(path).startswith(f"refreshed_{REFRESH_MONTH}"):
+            os.remove(path)
 
 # ==========================================
 # 4. INITIALISATION SELENIUM (MODE HEADLESS)
 # ==========================================
-def init_driver():
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")  # Mode sans interface
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--window-size=1920,1080")
-    chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36")
-    
-    driver = webdriver.Chrome(options=chrome_options)
-    return driver
+# Les navigateurs du pool sont créés par browser.init_driver : mode économe
+# (ressources bloquées, chargement "eager") réglé par KHAMSAT_BROWSER_*
 
 # ==========================================
 # 5. FONCTIONS DE SCRAPING
 # ==========================================
-def load_infinite_scroll(driver, wait, max_clicks=50):
-    """Clique sur 'Voir plus' jusqu'à la fin (limite à 50 clics)."""
+def load_infinite_scroll(driver, wait, cat_url, max_clicks=50, on_page=None):
+    """Clique sur 'Voir plus' jusqu'à la fin (limite à 50 clics).
+
+    Chaque clic attend son jeton du limiteur (classe du navigateur, distincte
+    du listing HTTP dont la latence n'inclut pas le rendu)
+    puis l'arrivée de nouvelles cartes, sans pause fixe. `on_page` est
+    appelé après chaque chargement pour lire les nouvelles cartes au fil de l'eau.
+    """
+    endpoint = browser_class(cat_url)
     click_count = 0
     while click_count < max_clicks:
         try:
-            load_btn = wait.until(
-                EC.element_to_be_clickable((By.XPATH, '//*[@id="load_more_content"]'))
-            )
-            driver.execute_script("arguments[0].scrollIntoView();", load_btn)
-            time.sleep(0.5)
-            driver.execute_script("arguments[0].click();", load_btn)
+            load_btn = wait.until(EC.element_to_be_clickable((By.XPATH, LOAD_MORE_XPATH)))
+            before = len(driver.find_elements(By.XPATH, CARD_XPATH))
+            limiter.acquire(cat_url, endpoint)
+            start = time.perf_counter()
+            driver.execute_script("arguments[0].scrollIntoView(); arguments[0].click();", load_btn)
+            wait.until(lambda d: len(d.find_elements(By.XPATH, CARD_XPATH)) > before)
+            limiter.recover(cat_url, time.perf_counter() - start, endpoint)
             click_count += 1
             log_print(f"   ⏳ Chargement page {click_count}...")
-            time.sleep(2)
+            if on_page:
+                on_page()
         except:
             break
     
     if click_count > 0:
         log_print(f"   📄 {click_count} pages chargées")
 
-def extract_page_data(driver, category_name):
-    """Extrait les données des services."""
-    services = driver.find_elements(By.XPATH, "//div[starts-with(@id,'service-')]")
-    extracted_rows = []
-
-    for svc in services:
-        try:
-            link_elem = svc.find_element(By.XPATH, ".//div/div[2]/h4/a")
-            title = link_elem.text.strip()
-            link = link_elem.get_attribute("href").strip()
-            
-            try:
-                img_elem = svc.find_element(By.XPATH, ".//div/div[1]//img")
-                img_src = img_elem.get_attribute("src").strip()
-            except:
-                img_src = "N/A"
-
-            extracted_rows.append([category_name, title, link, img_src])
-        except:
-            continue
-    
-    return extracted_rows
-
 # ==========================================
 # 6. TRAITEMENT DE CHAQUE FICHIER CSV
 # ==========================================
-def process_csv_file(csv_path, driver, wait):
-    """Traite un fichier CSV de sous-catégories."""
-    
-    input_filename = os.path.splitext(os.path.basename(csv_path))[0]
-    output_csv = os.path.join(resultats_dir, f"Resultats_{input_filename}.csv")
-    
-    log_print(f"\n{'='*50}")
-    log_print(f"📁 Traitement : {input_filename}")
-    log_print(f"{'='*50}")
-    
-    # Chargement de la progression
-    processed_urls = load_progress(input_filename)
-    if processed_urls:
-        log_print(f"🔄 Reprise : {len(processed_urls)} catégories déjà traitées")
-    
-    # Initialisation du CSV de sortie
-    file_exists = os.path.exists(output_csv)
-    if not file_exists:
-        with open(output_csv, mode='w', newline='', encoding='utf-8-sig') as f:
-            writer = csv.writer(f)
-            writer.writerow(["Catégorie", "Titre du Service", "Lien du Service", "Image URL"])
-    
-    # Lecture des sous-catégories
-    try:
-        with open(csv_path, "r", encoding="utf-8-sig") as f:
-            reader = csv.reader(f)
-            next(reader, None)  # Sauter l'en-tête
-            rows = list(reader)
-    except Exception as e:
-        log_print(f"❌ Erreur lecture {csv_path}: {e}", "error")
-        return 0
-    
-    total_rows = len(rows)
-    total_services = 0
-    
-    # Traitement de chaque sous-catégorie
-    for i, row in enumerate(rows):
-        if len(row) < 2:
-            continue
-        
-        cat_name = row[0]
-        cat_url = row[1]
-        
-        # Vérifier si déjà traité
-        if cat_url in processed_urls:
+class ResultFile:
+    """Listing Resultats_* d'un fichier de sous-catégories, écrit via le stockage.
+
+    En mode rafraîchissement, le listing est reconstruit dans une source
+    temporaire qui ne remplace l'ancien qu'une fois toutes les
+    sous-catégories traitées.
+    """
+
+    def __init__(self, csv_path):
+        self.input_filename = os.path.splitext(os.path.basename(csv_path))[0]
+        self.source = f"Resultats_{self.input_filename}"
+        self.progress_name = f"refresh_{self.input_filename}" if REFRESH else self.input_filename
+        self.output_source = f".refresh_{self.source}" if REFRESH else self.source
+        self.total_services = 0
+        # Sous-catégories lancées mais pas encore enregistrées ; `listed` passe
+        # à True une fois le fichier d'entrée lu jusqu'au bout
+        self.remaining = 0
+        self.listed = False
+        # Listing déjà rafraîchi ce mois-ci (run précédent de la chaîne)
+        self.refreshed = REFRESH and os.path.exists(refresh_marker(self.input_filename))
+
+        # Chargement de la progression
+        self.processed_urls = load_progress(self.progress_name)
+
+    def write(self, rows):
+        """Ajoute les lignes inédites (catégorie, lien) et retourne leur nombre."""
+        added = storage.write_listings(self.output_source, rows)
+        # Écrit sur disque avant que la sous-catégorie soit marquée comme traitée
+        storage.flush()
+        self.total_services += added
+        return added
+
+    def close(self):
+        self.processed_urls.close()
+        if REFRESH and self.listed and self.remaining == 0:
+            # Listing complet : il remplace l'ancien, la progression repart à zéro
+            storage.promote_listings(self.output_source, self.source)
+            paths = progress_paths(progress_dir, self.progress_name) + (index_path(progress_dir, self.progress_name),)
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            touch(refresh_marker(self.input_filename))
+            self.refreshed = True
+            log_print(f"🔁 {self.source} rafraîchi", "success")
+
+
+def iter_subcategories(csv_files, outputs):
+    """Parcourt les sous-catégories restantes de tous les fichiers (file de tâches commune).
+
+    Les fichiers sont lus en flux : les tâches sont produites à la demande
+    des workers, sans charger toutes les lignes en mémoire.
+    """
+    for csv_path in csv_files:
+        output = ResultFile(csv_path)
+        outputs.append(output)
+        log_print(f"📁 {output.input_filename}")
+        if output.refreshed:
+            log_print(f"✅ {output.source} déjà rafraîchi ce mois-ci")
             continue
-        
-        log_print(f"➡️ [{i+1}/{total_rows}] {cat_name}")
-        
+        if output.processed_urls:
+            log_print(f"🔄 Reprise : {len(output.processed_urls)} catégories déjà traitées")
+
+        # Lecture des sous-catégories
         try:
-            driver.get(cat_url)
-            time.sleep(2)
-            
-            # Charger toutes les pages
-            load_infinite_scroll(driver, wait)
-            
-            # Extraire les données
-            data = extract_page_data(driver, cat_name)
-            count = len(data)
-            total_services += count
-            
-            if count > 0:
-                # Sauvegarder dans le CSV
-                with open(output_csv, mode='a', newline='', encoding='utf-8-sig') as f_out:
-                    writer = csv.writer(f_out)
-                    writer.writerows(data)
-                
-                log_print(f"   ✅ {count} services récupérés", "success")
-            else:
-                log_print(f"   ⚠️ 0 service trouvé", "warning")
-            
-            # Marquer comme traité
-            processed_urls.add(cat_url)
-            save_progress(input_filename, processed_urls)
-            
-            # Pause anti-ban
-            time.sleep(3)
-            
+            with open(csv_path, "r", encoding="utf-8-sig") as f:
+                reader = csv.reader(f)
+                next(reader, None)  # Sauter l'en-tête
+                for i, row in enumerate(reader):
+                    # Un nœud parent (Feuille = 0) est couvert par ses enfants
+                    if len(row) >= 5 and row[4] == "0":
+                        continue
+                    if len(row) < 2 or not shard.owns(canonical_url(row[1])):
+                        continue
+                    if row[1] not in output.processed_urls:
+                        output.remaining += 1
+                        yield output, i, row[0], row[1]
         except Exception as e:
-            log_print(f"   ❌ Erreur : {e}", "error")
+            log_print(f"❌ Erreur lecture {csv_path}: {e}", "error")
             continue
-    
-    log_print(f"\n{'='*50}")
-    log_print(f"📊 {input_filename} : {total_services} services au total")
-    log_print(f"{'='*50}")
-    
-    return total_services
+        output.listed = True
+
+
+def scrape_subcategory(driver, task):
+    """Charge une sous-catégorie dans le navigateur du worker et extrait ses services."""
+    _, _, cat_name, cat_url = task
+    endpoint = browser_class(cat_url)
+    limiter.acquire(cat_url, endpoint)
+    start = time.perf_counter()
+    driver.get(cat_url)
+    try:
+        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.XPATH, CARD_XPATH)))
+        limiter.recover(cat_url, time.perf_counter() - start, endpoint)
+    except TimeoutException:
+        if "Just a moment" in driver.title:
+            limiter.backoff(cat_url, endpoint=endpoint, reason="challenge")
+
+    # Extraction incrémentale : seules les cartes ajoutées depuis le dernier
+    # 'Voir plus' sont lues
+    data = []
+    parsed = 0
+
+    def collect():
+        nonlocal parsed
+        rows, parsed = extract_page_data(driver, cat_name, parsed)
+        data.extend(rows)
+
+    collect()
+    load_infinite_scroll(driver, WebDriverWait(driver, 10), cat_url, on_page=collect)
+    collect()
+    # Trafic de la page déjà chargée (journal de performance lu une seule
+    # fois, 'Voir plus' compris), sans rechargement échantillonné
+    record_page(driver)
+    return data
+
+def crawl_subcategory_http(session, limiter, cache, task):
+    """Parcourt une sous-catégorie via l'endpoint paginé. None => fallback navigateur.
+
+    Une page en échec au milieu de la pagination donne aussi None : la
+    sous-catégorie n'est ni marquée traitée ni promue sur un listing tronqué.
+    """
+    _, _, cat_name, cat_url = task
+    try:
+        pages = crawl_listing(session, cat_url, cat_name, limiter, log_print, cache, parser)
+        if pages is None:
+            return None
+        data = []
+        for rows in pages:
+            data.extend(rows)
+        return data
+    except Exception as e:
+        log_print(f"   ↪️ Échec HTTP sur {cat_url} ({e})", "warning")
+        return None
+
+
+def save_subcategory(task, data, error):
+    """Écrit les services d'une sous-catégorie et la marque comme traitée."""
+    output, i, cat_name, cat_url = task
+    log_print(f"➡️ [{output.input_filename} #{i+1}] {cat_name}")
+
+    if error is not None:
+        log_print(f"   ❌ Erreur : {error}", "error")
+        metrics.inc("subcategories_total", status="error")
+        return
+
+    if data and classifier:
+        services = [row for row in data if classifier.classify(row[2]) == SERVICE]
+        if len(services) < len(data):
+            log_print(f"   ↪️ {len(data) - len(services)} liens hors services ignorés")
+        data = services
+
+    if data:
+        added = output.write(data)
+        log_print(f"   ✅ {len(data)} services récupérés ({added} nouveaux)", "success")
+        metrics.inc("subcategories_total", status="ok")
+        metrics.inc("services_total", len(data), status="listed")
+        metrics.inc("services_new_total", added)
+    else:
+        log_print(f"   ⚠️ 0 service trouvé", "warning")
+        metrics.inc("subcategories_total", status="empty")
+
+    # Marquer comme traité
+    output.processed_urls.add(cat_url)
+    output.remaining -= 1
 
 # ==========================================
 # 7. BOUCLE PRINCIPALE
 # ==========================================
 
-driver = None
-grand_total = 0
+outputs = []
+# Pool de parsing (KHAMSAT_PARSE_WORKERS), créé avant tout thread car ses
+# workers sont forkés ; inutile en mode navigateur
+parser = ParsePool.from_env() if LISTING_MODE == "http" else ParsePool(0)
+metrics.start("rac3", metrics_dir)
+storage = shard.open_storage(base_dir)
+pool = BrowserPool(init_driver, BROWSER_WORKERS, BROWSER_MAX_PAGES, BROWSER_MAX_RSS_MB, log_print)
+session = make_session(LISTING_WORKERS)
+# Débit adaptatif partagé par le HTTP et les navigateurs, repris du dernier run
+limiter = HostRateLimiter.from_env(RATE_PER_HOST)
+cache = cache_from_env()
 
 try:
-    driver = init_driver()
-    wait = WebDriverWait(driver, 10)
-    
-    for csv_file in csv_files:
-        try:
-            total = process_csv_file(csv_file, driver, wait)
-            grand_total += total
-        except Exception as e:
-            log_print(f"❌ Erreur critique sur {csv_file}: {e}", "error")
-            continue
+    tasks = iter_subcategories(csv_files, outputs)
+
+    # Mode HTTP : pagination directe, le navigateur ne reprend que les échecs
+    if LISTING_MODE == "http":
+        log_print(f"🌐 Mode HTTP : {LISTING_WORKERS} sous-catégories en parallèle")
+        browser_tasks = []
+        results = ordered_map(lambda task: crawl_subcategory_http(session, limiter, cache, task), tasks, LISTING_WORKERS,
+                              name="listing")
+        for task, data, error in results:
+            if error is not None:
+                log_print(f"   ↪️ Échec HTTP sur {task[3]} ({error})", "warning")
+            if data is None:
+                browser_tasks.append(task)
+            else:
+                save_subcategory(task, data, None)
+        if browser_tasks:
+            log_print(f"↪️ {len(browser_tasks)} sous-catégories repassent par Selenium")
+    else:
+        browser_tasks = tasks
+
+    log_print(f"🧵 {BROWSER_WORKERS} navigateurs Chrome en parallèle")
+    for task, data, error in pool.map(scrape_subcategory, browser_tasks):
+        save_subcategory(task, data, error)
 
 except KeyboardInterrupt:
     log_print("\n🛑 Interruption utilisateur", "warning")
@@ -261,13 +384,31 @@ except Exception as e:
     log_print(f"❌ Erreur globale : {e}", "error")
 
 finally:
-    if driver:
-        driver.quit()
+    session.close()
+    parser.close()
+    limiter.save()
+    if cache:
+        removed, size = cache.prune()
+        log_print(f"🗄️ Cache HTTP : {size / 1e6:.1f} Mo ({removed} entrées évincées)")
+    pool.close()
+    for output in outputs:
+        output.close()
+    storage.close()
+    if REFRESH and outputs and len(outputs) == len(csv_files) and all(output.refreshed for output in outputs):
+        touch(refresh_marker())
+        log_print(f"🗓️ Rafraîchissement de {REFRESH_MONTH} terminé", "success")
+    
+    grand_total = sum(output.total_services for output in outputs)
     
     # RAPPORT FINAL
     log_print("\n" + "=" * 50)
     log_print("       📊 RAPPORT FINAL")
     log_print("=" * 50)
+    for output in outputs:
+        log_print(f"📊 {output.input_filename} : {output.total_services} services")
     log_print(f"📁 Dossier résultats : {resultats_dir}")
     log_print(f"🎯 TOTAL GÉNÉRAL : {grand_total} services extraits")
+    metrics.stop({"files": {output.input_filename: output.total_services for output in outputs},
+                  "browser": traffic_summary()})
+    log_print(f"📈 Résumé : {metrics.summary_path}")
     log_print("=" * 50)
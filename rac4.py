@@ -1,15 +1,35 @@
-import csv
 import time
 import os
-import json
 import glob
 import logging
-from collections import defaultdict
-from selenium import webdriver
+import threading
+from datetime import datetime, timezone
+from itertools import chain
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import TimeoutException
+
+from browser import init_driver, record_page, traffic_summary
+from fetch_pool import ordered_map
+from http_cache import cache_from_env
+from http_client import make_session
+from metrics import metrics
+from parse_pool import ParsePool
+from progress_store import ProgressIndex, url_digest
+from records import RecordBatch, ServiceDetail
+from rate_limit import HostRateLimiter, browser_class
+from refresh import open_verified, pending_count, plan_refresh
+from retry_queue import RetryQueue, failure_kind
+from scheduler import Scheduler, service_priority
+from shard import Shard, ShardStorage
+from stats import build_reports
+from service_extract import (
+    EXTRACT_FIELDS_ARGS, EXTRACT_FIELDS_JS, READY_XPATH, FieldTimings,
+    browser_result, fetch_service_details, missing_required
+)
+from storage import DETAILS_HEADER, DETAILS_LINK, DETAILS_VERIFIED, open_storage
+from url_classifier import SERVICE, canonical_url, load_classifier
 
 # ============================
 # 1️⃣ CONFIGURATION POUR GITHUB ACTIONS
@@ -17,8 +37,36 @@ from selenium.webdriver.chrome.options import Options
 
 base_dir = os.path.join(os.getcwd(), "categories")
 resultats_dir = os.path.join(base_dir, "resultats")
-details_dir = os.path.join(base_dir, "details_services")
-progress_dir = os.path.join(base_dir, "progress_details")
+
+# Mode shard (--shard i/N ou KHAMSAT_SHARD) : seuls les services dont l'id
+# tombe dans le shard sont traités, avec progression et sorties propres au
+# shard sous categories/shards/ (fusion par merge_shards.py)
+shard = Shard.from_argv()
+work_dir = shard.directory(base_dir)
+details_dir = os.path.join(work_dir, "details_services")
+progress_dir = os.path.join(work_dir, "progress_details")
+metrics_dir = os.path.join(work_dir, "metrics")
+manifest_file = os.path.join(work_dir, "remaining_work.json")
+
+# Pipeline concurrent : pages en vol et débit initial par classe d'endpoint (requêtes/s)
+DETAIL_WORKERS = int(os.environ.get("KHAMSAT_DETAIL_WORKERS", "8"))
+RATE_PER_HOST = float(os.environ.get("KHAMSAT_RATE_PER_HOST", "2"))
+
+# Mode incrémental (rafraîchissement mensuel) : ne re-scrape que les services
+# nouveaux ou dont le listing a changé depuis la dernière vérification
+INCREMENTAL = os.environ.get("KHAMSAT_INCREMENTAL", "0") == "1"
+
+# Nombre de lignes de détails écrites par lot
+STORAGE_BATCH = int(os.environ.get("KHAMSAT_STORAGE_BATCH", "100"))
+
+# Échéance du run (KHAMSAT_DEADLINE_MINUTES, 0 = aucune) : plus aucun service
+# n'est lancé quand le temps restant ne couvre plus la marge et ceux en vol
+scheduler = Scheduler.from_env(manifest_file)
+
+# Le manifeste du run précédent n'est plus à jour : s'il manque en fin de
+# run (arrêt brutal), l'étape de relance recalcule le travail restant
+if os.path.exists(manifest_file):
+    os.remove(manifest_file)
 
 # Création des dossiers
 for directory in [details_dir, progress_dir]:
@@ -26,7 +74,7 @@ for directory in [details_dir, progress_dir]:
         os.makedirs(directory)
 
 # Log principal
-log_file = os.path.join(base_dir, "journal_details_services.log")
+log_file = os.path.join(work_dir, "journal_details_services.log")
 
 # Configuration du Logging
 logging.basicConfig(
@@ -51,214 +99,378 @@ def log_print(msg, level="info"):
 
 log_print("=" * 60)
 log_print("🚀 DÉMARRAGE EXTRACTION DÉTAILS SERVICES KHAMSAT")
+if shard.enabled:
+    log_print(f"🧩 Shard {shard} : {work_dir}")
 log_print("=" * 60)
 
 # ============================
 # 2️⃣ RÉCUPÉRATION DES FICHIERS RÉSULTATS
 # ============================
 
-result_files = glob.glob(os.path.join(resultats_dir, "Resultats_*.csv"))
+# Stockage choisi par KHAMSAT_STORAGE (csv par défaut, ou sqlite)
+if shard.enabled:
+    storage = ShardStorage(open_storage(base_dir), shard.open_storage(base_dir),
+                           lambda link: shard.owns(service_key(link)))
+else:
+    storage = open_storage(base_dir)
+result_sources = storage.listing_sources()
 
-if not result_files:
+if not result_sources:
     log_print(f"❌ Aucun fichier résultat trouvé dans {resultats_dir}", "error")
     exit(1)
 
-log_print(f"📂 {len(result_files)} fichiers résultats trouvés")
+log_print(f"📂 {len(result_sources)} fichiers résultats trouvés")
+
+
+# Services en échec réessayés aux runs suivants (KHAMSAT_RETRY_*), avec
+# dead_letter.csv pour ceux abandonnés
+retry_queue = RetryQueue.from_env(progress_dir)
+
+
+def staleness(source):
+    """Plus ancienne date de vérification d'un fichier ("" si un service ne l'a jamais été).
+
+    Les lignes "Erreur" écrites avant la file de relance y sont ajoutées au passage.
+    """
+    dates = []
+    errors = []
+    for row in storage.iter_details(source):
+        dates.append(row[DETAILS_VERIFIED])
+        if row[0] == "Erreur":
+            errors.append(row[DETAILS_LINK])
+    seeded = retry_queue.seed(source, errors)
+    if seeded:
+        log_print(f"🔁 {source} : {seeded} anciennes erreurs mises en file de relance")
+    return min(dates) if dates else ""
+
+
+# Fichiers les moins récemment vérifiés d'abord (un run coupé reprend par eux)
+result_sources.sort(key=staleness)
+retry_queue.save()
+
+# Classifieur d'URLs : les liens qui ne sont pas des services ne sont pas visités
+classifier = load_classifier(base_dir)
+
+
+def is_service(link):
+    return bool(link) and (classifier is None or classifier.classify(link) == SERVICE)
+
+
+def service_key(link):
+    """Clé canonique d'un service (id), commune à tous les fichiers résultats."""
+    return classifier.service_key(link) if classifier else canonical_url(link)
 
 # ============================
 # 3️⃣ GESTION DE LA PROGRESSION
 # ============================
 def load_progress(filename):
-    progress_file = os.path.join(progress_dir, f"progress_{filename}.json")
-    if os.path.exists(progress_file):
-        with open(progress_file, 'r', encoding='utf-8') as f:
-            return set(json.load(f))
-    return set()
+    """Ouvre l'index de progression (convertit les anciens progress_*.json)."""
+    return ProgressIndex(progress_dir, filename)
+
+
+def has_progress(source):
+    return bool(glob.glob(os.path.join(glob.escape(progress_dir), f"progress_{glob.escape(source)}.*")))
+
+
+def open_fetched_index():
+    """Index global des services récupérés, tous fichiers confondus.
 
-def save_progress(filename, processed_set):
-    progress_file = os.path.join(progress_dir, f"progress_{filename}.json")
-    with open(progress_file, 'w', encoding='utf-8') as f:
-        json.dump(list(processed_set), f, ensure_ascii=False)
+    Il est propre au mois en cours (un passage peut s'étaler sur plusieurs
+    runs) ; ceux des mois précédents sont supprimés. En mode complet, il est
+    aussi remis à zéro quand aucun fichier n'a de progression (rafraîchissement
+    complet après suppression des progress_Resultats_*).
+    """
+    name = f"services_{datetime.now(timezone.utc):%Y-%m}"
+    reset = not INCREMENTAL and not any(has_progress(source) for source in result_sources)
+    for path in glob.glob(os.path.join(glob.escape(progress_dir), "progress_services*")):
+        if reset or not os.path.basename(path).startswith(f"progress_{name}."):
+            os.remove(path)
+    return load_progress(name)
+
+
+def record_membership(base_name):
+    """Enregistre les couples (service, catégorie) du listing, par lots."""
+    batch = []
+    for listing in storage.iter_listings(base_name):
+        link = listing.link.strip()
+        if is_service(link):
+            batch.append([service_key(link), link, base_name, listing.category])
+        if len(batch) >= STORAGE_BATCH:
+            storage.write_membership(batch)
+            batch = []
+    storage.write_membership(batch)
+
+
+def prioritize(base_name, links):
+    """Ordonne les services à scraper : inconnus, puis plus achetés, puis plus anciens."""
+    known = {row[DETAILS_LINK]: row for row in storage.iter_details(base_name)}
+    return sorted(links, key=lambda link: service_priority(known.get(link)))
+
+
+def remaining_work():
+    """Services restant à traiter par fichier résultat, pour le manifeste."""
+    remaining = {}
+    for source in result_sources:
+        if INCREMENTAL:
+            remaining[source] = pending_count(storage, source, progress_dir)
+            continue
+        with load_progress(source) as done:
+            remaining[source] = sum(1 for listing in storage.iter_listings(source)
+                                    if is_service(listing.link.strip()) and listing.link.strip() not in done)
+    return remaining
 
 # ============================
 # 4️⃣ INITIALISATION SELENIUM
 # ============================
-def init_driver():
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--window-size=1920,1080")
-    chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36")
-    
-    driver = webdriver.Chrome(options=chrome_options)
-    return driver
+# Chrome économe (browser.init_driver, KHAMSAT_BROWSER_*), démarré à la demande
+driver = None
+wait = None
+driver_lock = threading.Lock()
+
+# Durées par champ des extractions Selenium (résumé en fin de run)
+field_timings = FieldTimings()
+
+def get_driver():
+    """Démarre Chrome à la première page qui en a besoin."""
+    global driver, wait
+    if driver is None:
+        log_print("🌐 Démarrage de Chrome pour le fallback Selenium")
+        driver = init_driver()
+        wait = WebDriverWait(driver, 15)
+    return driver, wait
 
 # ============================
 # 5️⃣ FONCTION D'EXTRACTION
 # ============================
-def get_text(driver, wait, xpath, default="Non trouvé"):
-    try:
-        element = wait.until(EC.presence_of_element_located((By.XPATH, xpath)))
-        return element.get_attribute("textContent").strip()
-    except:
-        return default
+def extract_service_details_browser(driver, wait, link):
+    """Extrait tous les détails d'un service via Selenium (pages rendues en JS).
 
-def extract_service_details(driver, wait, link):
-    """Extrait tous les détails d'un service."""
+    Une seule attente (présence du titre), puis une seule évaluation JS pour
+    tous les champs : un champ absent prend sa valeur par défaut sans délai.
+    """
     try:
+        start = time.perf_counter()
         driver.get(link)
-        time.sleep(2)
-        
-        # Extraction des données
-        title = get_text(driver, wait, '//h1')
-        owner = get_text(driver, wait, '//div[@id="service_owner"]//a[contains(@class, "sidebar_user")]')
-        buyers = get_text(driver, wait, '//div[contains(@class, "col-6")][span[contains(text(), "المشترين")]]/following-sibling::div[1]/span')
-        
-        votes = get_text(driver, wait, '//div[contains(@class, "col-6")][span[contains(text(), "التقييمات")]]/following-sibling::div[1]//li[contains(@class, "info")]')
-        votes = votes.replace("(", "").replace(")", "")
-        
-        last_date = get_text(driver, wait, '//*[@id="reviews-section"]//div[contains(@class, "review_section")][1]//div[contains(@class, "meta--date")]/span[2]', "Aucun avis")
-        
-        # Extraction des mots-clés
         try:
-            tags_elements = driver.find_elements(By.XPATH, '//ul[contains(@class, "c-list--tags")]//li//a')
-            tags_list = [tag.text.strip() for tag in tags_elements if tag.text.strip()]
-            keywords = ", ".join(tags_list) if tags_list else "Aucun tag"
-        except:
-            keywords = "Erreur Tags"
-        
-        # Catégories
-        cat_main = get_text(driver, wait, '//ol[contains(@class, "breadcrumb")]//li[2]//a', "Inconnu")
-        cat_sub = get_text(driver, wait, '//ol[contains(@class, "breadcrumb")]//li[3]//a', "Inconnu")
+            wait.until(EC.presence_of_element_located((By.XPATH, READY_XPATH)))
+        except TimeoutException:
+            log_print("   ⚠️ Titre introuvable après l'attente, lecture de la page telle quelle", "warning")
+        ready_ms = (time.perf_counter() - start) * 1000
         
-        return {
-            "title": title,
-            "owner": owner,
-            "buyers": buyers,
-            "votes": votes,
-            "last_date": last_date,
-            "cat_main": cat_main,
-            "cat_sub": cat_sub,
-            "keywords": keywords,
-            "link": link,
-            "status": "success"
-        }
+        # Extraction des données (mêmes XPath que le mode HTTP)
+        raw = driver.execute_script(EXTRACT_FIELDS_JS, EXTRACT_FIELDS_ARGS)
+        result, timings = browser_result(raw, link)
+        timings["ready"] = ready_ms
+        field_timings.add(timings)
+        for field, elapsed in timings.items():
+            metrics.observe("selenium_field_seconds", elapsed / 1000, field=field)
+        record_page(driver, link, limiter)
+        return result
         
     except Exception as e:
         log_print(f"   ❌ Erreur extraction {link}: {e}", "error")
-        return {
-            "title": "Erreur",
-            "owner": "Erreur",
-            "buyers": "0",
-            "votes": "0",
-            "last_date": "0",
-            "cat_main": "Erreur",
-            "cat_sub": "Erreur",
-            "keywords": "Erreur",
-            "link": link,
-            "status": "error"
-        }
+        return ServiceDetail(link, status="error", error=f"driver_{e.__class__.__name__}")
+
+def extract_service_details(session, limiter, cache, link, known=False):
+    """Extrait les détails en HTTP + lxml, Selenium seulement si des champs manquent."""
+    result = fetch_service_details(session, link, limiter, cache, known, parser)
+    if result.status == "unchanged":
+        return result
+    if result.status == "error":
+        # Service retiré (404, 410) : Chrome n'y trouvera rien non plus
+        if failure_kind(result.error) == "permanent":
+            return result
+        log_print(f"   ↪️ Échec HTTP ({result.error}), fallback Selenium")
+        metrics.inc("selenium_fallbacks_total", reason="http_failed")
+    else:
+        missing = missing_required(result)
+        if not missing:
+            return result
+        log_print(f"   ↪️ Champs manquants en HTTP ({', '.join(missing)}), fallback Selenium")
+        metrics.inc("selenium_fallbacks_total", reason="missing_fields")
+    
+    # Un seul Chrome partagé entre les threads
+    with driver_lock:
+        driver, wait = get_driver()
+        limiter.acquire(link, browser_class(link))
+        return extract_service_details_browser(driver, wait, link)
 
 # ============================
 # 6️⃣ TRAITEMENT DE CHAQUE FICHIER
 # ============================
-def process_result_file(result_file, driver, wait):
-    """Traite un fichier de résultats."""
-    
-    base_name = os.path.splitext(os.path.basename(result_file))[0]
-    output_csv = os.path.join(details_dir, f"Details_{base_name}.csv")
-    stats_file = os.path.join(details_dir, f"Stats_{base_name}.txt")
+def process_result_file(base_name, session, limiter, cache):
+    """Traite un fichier de résultats ; ses statistiques vont dans file_stats."""
     
     log_print(f"\n{'='*60}")
     log_print(f"📁 Traitement : {base_name}")
     log_print(f"{'='*60}")
     
-    # Chargement progression
-    processed_links = load_progress(base_name)
-    if processed_links:
-        log_print(f"🔄 Reprise : {len(processed_links)} services déjà traités")
+    verified_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M")
     
-    # Initialisation CSV sortie
-    file_exists = os.path.exists(output_csv)
-    if not file_exists:
-        with open(output_csv, "w", newline="", encoding="utf-8-sig") as f:
-            writer = csv.writer(f)
-            writer.writerow(["Titre", "Vendeur", "Acheteurs", "Notes", "Date Dernier Avis", 
-                           "Catégorie", "Sous-Catégorie", "Mots Clés", "Lien"])
+    if INCREMENTAL:
+        # Mode incrémental : seuls les services nouveaux ou modifiés sont scrapés,
+        # les lignes inchangées sont reportées avec la date de vérification ;
+        # celles des services modifiés restent en place jusqu'à leur upsert
+        # (un run interrompu ne les perd pas)
+        processed_links = open_verified(progress_dir, base_name)
+        try:
+            plan = plan_refresh(storage, base_name, processed_links)
+            carried = storage.carry_forward(base_name, plan.unchanged, verified_at, set(plan.changed))
+        except Exception as e:
+            log_print(f"❌ Erreur préparation {base_name}: {e}", "error")
+            processed_links.close()
+            return 0
+        log_print(f"🔁 {len(plan.new)} nouveaux, {len(plan.changed)} modifiés, "
+                  f"{len(plan.removed)} retirés, {carried} reportés tels quels")
+        services = prioritize(base_name, plan.todo)
+        log_print(f"🎯 {len(services)} services à traiter")
+        mark_done = lambda link: processed_links.add(plan.entry(link))
+        known_links = set()
+    else:
+        # Chargement progression
+        processed_links = load_progress(base_name)
+        if processed_links:
+            log_print(f"🔄 Reprise : {len(processed_links)} services déjà traités")
+        mark_done = processed_links.add
+        
+        # Liens déjà présents (empreintes) : une page inchangée n'est pas réécrite
+        known_links = {url_digest(link) for link in storage.detail_links(base_name)}
+        
+        # Listing source lu en flux, filtré au fil de l'eau par l'index
+        def pending_services():
+            for listing in storage.iter_listings(base_name):
+                link = listing.link.strip()
+                if is_service(link) and link not in processed_links:
+                    yield link
+        
+        services = pending_services()
+        log_print("🎯 Services à traiter : lecture en flux du listing")
     
-    # Lecture du fichier source
-    services = []
-    try:
-        with open(result_file, "r", encoding="utf-8-sig") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                link = row.get("Lien du Service", row.get("link", "")).strip()
-                if link and link not in processed_links:
-                    services.append(link)
-    except Exception as e:
-        log_print(f"❌ Erreur lecture {result_file}: {e}", "error")
-        return 0
+    # Services en échec dont le délai de relance est écoulé, traités en premier
+    retries = retry_queue.due(base_name)
+    if INCREMENTAL:
+        for link in retries:
+            if link not in plan.signatures:
+                retry_queue.forget(link)
+        retries = [link for link in retries if link in plan.signatures]
+    if retries:
+        log_print(f"🔁 {len(retries)} services en échec à réessayer")
+        services = chain(retries, services)
     
-    total_services = len(services)
-    log_print(f"🎯 {total_services} services à traiter")
+    total_services = 0
     
     # Statistiques
-    stats_categories = defaultdict(int)
     total_success = 0
     total_errors = 0
+    total_unchanged = 0
+    total_duplicates = 0
+    total_retried = 0
+    
+    # Lignes de détails du lot en cours (par colonnes), écrites en une fois ;
+    # leurs liens sont marqués traités après le flush du stockage. Les
+    # services en échec, sans ligne, sont marqués traités (la file de relance
+    # s'en charge) mais pas récupérés.
+    batch = RecordBatch(DETAILS_HEADER)
+    written = []
+    failed = []
+    
+    def flush_done():
+        # Upsert sur le lien du service : une relance réussie remplace la ligne "Erreur"
+        storage.write_details(base_name, batch.rows())
+        batch.clear()
+        storage.flush()
+        for done in written:
+            mark_done(done)
+            fetched_services.add(service_key(done))
+        written.clear()
+        for done in failed:
+            mark_done(done)
+        failed.clear()
+        retry_queue.save()
+    
+    def skip_duplicates(links):
+        """Ne laisse passer qu'une fois par run chaque service (même id, autre URL ou fichier)."""
+        nonlocal total_duplicates
+        for link in links:
+            key = service_key(link)
+            if key in claimed_services or key in fetched_services:
+                total_duplicates += 1
+                metrics.inc("duplicates_total")
+                mark_done(link)
+                continue
+            claimed_services.add(key)
+            yield link
     
-    # Traitement de chaque service
-    for i, link in enumerate(services, 1):
-        log_print(f"⏳ [{i}/{total_services}] {link}")
+    try:
+        record_membership(base_name)
         
-        result = extract_service_details(driver, wait, link)
+        # Traitement concurrent, résultats écrits dans l'ordre du fichier source
+        results = ordered_map(
+            lambda link: extract_service_details(session, limiter, cache, link, url_digest(link) in known_links),
+            scheduler.admit(skip_duplicates(services)),
+            DETAIL_WORKERS,
+            name="details",
+        )
+        for i, (link, result, error) in enumerate(results, 1):
+            total_services = i
+            if error is not None:
+                # Exception inattendue sur ce service : échec transitoire, les autres continuent
+                log_print(f"   💥 {error.__class__.__name__} : {error}", "error")
+                result = ServiceDetail(link, status="error", error=error.__class__.__name__)
+            scheduler.done()
+            log_print(f"⏳ [{i}] {link}")
         
-        # Écriture dans CSV
-        with open(output_csv, "a", newline="", encoding="utf-8-sig") as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                result["title"],
-                result["owner"],
-                result["buyers"],
-                result["votes"],
-                result["last_date"],
-                result["cat_main"],
-                result["cat_sub"],
-                result["keywords"],
-                result["link"]
-            ])
+            # Page identique à la version en cache : ligne existante conservée
+            metrics.inc("services_total", status=result.status)
+            if result.status == "error":
+                total_errors += 1
+                if retry_queue.fail(link, base_name, result.error or "unknown") == "retry":
+                    # Pas de ligne "Erreur" : la ligne précédente éventuelle est conservée
+                    total_retried += 1
+                    failed.append(link)
+                    log_print(f"   🔁 Échec transitoire ({result.error}), relance au prochain run", "warning")
+                    if len(written) + len(failed) >= STORAGE_BATCH:
+                        flush_done()
+                    continue
+                log_print(f"   🪦 Abandonné ({result.error}) : voir {retry_queue.dead_letter_path}", "warning")
+            else:
+                retry_queue.succeeded(link)
+            
+            if result.status == "unchanged":
+                total_unchanged += 1
+                written.append(link)
+                log_print("   💤 Inchangé depuis la dernière visite")
+                continue
         
-        # Mise à jour stats
-        if result["status"] == "success":
-            total_success += 1
-            full_cat = f"{result['cat_main']} > {result['cat_sub']}"
-            stats_categories[full_cat] += 1
-            log_print(f"   ✅ OK | Tags: {result['keywords'][:50]}...", "success")
-        else:
-            total_errors += 1
-            stats_categories["Erreurs > Liens cassés"] += 1
+            batch.append(result.as_row(verified_at))
         
-        # Marquer comme traité
-        processed_links.add(link)
-        save_progress(base_name, processed_links)
+            # Mise à jour stats
+            if result.status == "success":
+                total_success += 1
+                log_print(f"   ✅ OK | Tags: {', '.join(result.keywords)[:50]}...", "success")
         
-        # Pause anti-ban
-        time.sleep(2)
+            # Marquer comme traité
+            written.append(link)
+            if len(written) + len(failed) >= STORAGE_BATCH:
+                flush_done()
+    finally:
+        scheduler.pause()
+        flush_done()
+        processed_links.close()
     
-    # Sauvegarde des statistiques
-    with open(stats_file, "w", encoding="utf-8") as f:
-        f.write(f"RAPPORT - {base_name}\n")
-        f.write("=" * 60 + "\n")
-        f.write(f"Total traités : {total_services}\n")
-        f.write(f"Succès        : {total_success}\n")
-        f.write(f"Erreurs       : {total_errors}\n\n")
-        f.write("DÉTAILS PAR CATÉGORIE :\n")
-        for cat, count in sorted(stats_categories.items()):
-            f.write(f"- {cat} : {count}\n")
+    # Compteurs de ce run pour le fichier (les statistiques complètes sont dans stats/)
+    file_stats[base_name] = {
+        "total": total_services,
+        "success": total_success,
+        "errors": total_errors,
+        "unchanged": total_unchanged,
+        "duplicates": total_duplicates,
+        "retried": total_retried,
+    }
     
-    log_print(f"\n📊 {base_name} : {total_success} succès, {total_errors} erreurs")
+    log_print(f"\n📊 {base_name} : {total_success} succès, {total_errors} erreurs "
+              f"({total_retried} en file de relance), {total_unchanged} inchangés, "
+              f"{total_duplicates} doublons évités")
     
     return total_success
 
@@ -266,19 +478,29 @@ def process_result_file(result_file, driver, wait):
 # 7️⃣ BOUCLE PRINCIPALE
 # ============================
 
-driver = None
 grand_total = 0
+file_stats = {}
+# Pool de parsing (KHAMSAT_PARSE_WORKERS), créé avant tout thread car ses
+# workers sont forkés
+parser = ParsePool.from_env()
+metrics.start("rac4", metrics_dir)
+# Services déjà récupérés (index persistant) ou en cours dans ce processus
+fetched_services = open_fetched_index()
+claimed_services = set()
+session = make_session(DETAIL_WORKERS)
+# Débit adaptatif, repris du dernier run (.cache/throttle_state.json)
+limiter = HostRateLimiter.from_env(RATE_PER_HOST)
+cache = cache_from_env()
 
 try:
-    driver = init_driver()
-    wait = WebDriverWait(driver, 15)
-    
-    for result_file in result_files:
+    for base_name in result_sources:
+        if scheduler.stopped:
+            break
         try:
-            total = process_result_file(result_file, driver, wait)
+            total = process_result_file(base_name, session, limiter, cache)
             grand_total += total
         except Exception as e:
-            log_print(f"❌ Erreur critique sur {result_file}: {e}", "error")
+            log_print(f"❌ Erreur critique sur {base_name}: {e}", "error")
             continue
 
 except KeyboardInterrupt:
@@ -288,8 +510,37 @@ except Exception as e:
     log_print(f"❌ Erreur globale : {e}", "error")
 
 finally:
+    if scheduler.stopped:
+        log_print(f"⏰ Échéance proche : arrêt propre ({scheduler.remaining() / 60:.0f} min restantes)", "warning")
+    session.close()
+    parser.close()
+    limiter.save()
+    try:
+        manifest = scheduler.write_manifest(manifest_file, remaining_work())
+        log_print(f"📋 Travail restant : {manifest['remaining']} services "
+                  f"(~{manifest['estimated_minutes']} min) -> {manifest_file}")
+    except Exception as e:
+        log_print(f"❌ Erreur manifeste : {e}", "error")
+    # Statistiques sur tous les détails (pas seulement ce run) ; en mode
+    # shard, elles sont produites après la fusion
+    if not shard.enabled:
+        try:
+            report = build_reports(storage, base_dir)
+            log_print(f"📊 Statistiques : {report['overall']['total']} services -> "
+                      f"{os.path.join(base_dir, 'stats')}")
+        except Exception as e:
+            log_print(f"❌ Erreur statistiques : {e}", "error")
+    storage.close()
+    fetched_services.close()
+    if cache:
+        removed, size = cache.prune()
+        log_print(f"🗄️ Cache HTTP : {size / 1e6:.1f} Mo ({removed} entrées évincées)")
     if driver:
         driver.quit()
+    if field_timings.stats:
+        log_print("⏱️ Durées Selenium par champ :")
+        for line in field_timings.summary():
+            log_print(f"   {line}")
     
     # RAPPORT FINAL
     log_print("\n" + "=" * 60)
@@ -297,4 +548,8 @@ finally:
     log_print("=" * 60)
     log_print(f"📁 Dossier détails : {details_dir}")
     log_print(f"🎯 TOTAL GÉNÉRAL : {grand_total} services détaillés")
+    log_print(f"🔁 File de relance : {len(retry_queue)} services ({retry_queue.path})")
+    summary = metrics.stop({"total_success": grand_total, "files": file_stats, "retry_queue": len(retry_queue),
+                            "browser": traffic_summary()})
+    log_print(f"📈 Résumé : {metrics.summary_path} ({summary['services_per_sec']} services/s)")
     log_print("=" * 60)
\ No newline at end of file
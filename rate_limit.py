@@ -0,0 +1,259 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from fsutils import atomic_open
+from metrics import metrics
+
+# /<catégorie>/<sous>/<id>-<slug> : page de service
+SERVICE_PATH = re.compile(r"/\d+(?:-[^/]*)?/?$")
+
+# Marqueurs des pages de challenge anti-bot (Cloudflare)
+CHALLENGE_MARKERS = (b"cf_chl_opt", b"challenge-platform", b"<title>Just a moment...</title>")
+
+
+def parse_retry_after(value):
+    """Convertit un en-tête Retry-After (secondes ou date HTTP) en secondes."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def endpoint_class(url):
+    """Classe d'endpoint d'une URL : "<hôte> service", "<hôte> listing" (paginé) ou "<hôte> page"."""
+    parsed = urlparse(url)
+    if SERVICE_PATH.search(parsed.path):
+        kind = "service"
+    elif parsed.query:
+        kind = "listing"
+    else:
+        kind = "page"
+    return f"{parsed.netloc} {kind}"
+
+
+def browser_class(url):
+    """Classe "<hôte> browser" : chargements et clics Selenium, dont la latence
+    (rendu JS compris) n'est pas comparable à celle des requêtes HTTP."""
+    return f"{urlparse(url).netloc} browser"
+
+
+def is_challenge(response):
+    """La réponse est une page de challenge (captcha) au lieu du contenu demandé."""
+    if response.headers.get("cf-mitigated", "").lower() == "challenge":
+        return True
+    if response.status_code not in (200, 403, 503):
+        return False
+    if "html" not in response.headers.get("Content-Type", "text/html"):
+        return False
+    head = response.content[:16384]
+    return any(marker in head for marker in CHALLENGE_MARKERS)
+
+
+class TokenBucket:
+    """Limiteur à jetons thread-safe piloté en AIMD.
+
+    Chaque réponse saine ajoute `increase / rate` au débit (environ `increase`
+    req/s de plus par seconde de trafic), jusqu'à `max_rate`. Un 429, un
+    captcha, une latence qui dérive ou un taux d'erreurs élevé le multiplie
+    par un facteur < 1, au plus une fois par fenêtre de latence, et un 429
+    suspend les requêtes pendant un délai avec jitter.
+
+    La latence de référence suit les baisses de la latence lissée tout de
+    suite et ses hausses lentement (`baseline_decay` par réponse) : un
+    minimum ponctuel ne fige pas la référence, d'un run à l'autre compris.
+    """
+
+    def __init__(self, rate, burst=1.0, min_rate=0.1, max_rate=None, increase=0.02,
+                 alpha=0.1, latency_factor=3.0, error_threshold=0.2, baseline_decay=0.01):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.min_rate = min_rate
+        self.max_rate = max_rate or rate
+        self.increase = increase
+        self.alpha = alpha
+        self.latency_factor = latency_factor
+        self.error_threshold = error_threshold
+        self.baseline_decay = baseline_decay
+        # Débit tenu sans incident depuis `healthy` réponses (celui qui est sauvegardé)
+        self.safe_rate = rate
+        self.healthy = 0
+        self.latency = None
+        self.baseline = None
+        self.error_rate = 0.0
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Bloque jusqu'à ce qu'un jeton soit disponible."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = max(self._blocked_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(delay)
+
+    def _decrease(self, factor):
+        """Baisse multiplicative, ignorée si une baisse vient d'avoir lieu (même rafale)."""
+        now = time.monotonic()
+        if now - self._last_decrease < max(1.0, self.latency or 0.0):
+            return False
+        self._last_decrease = now
+        self.rate = max(self.min_rate, self.rate * factor)
+        self.safe_rate = min(self.safe_rate, self.rate)
+        self.healthy = 0
+        return True
+
+    def backoff(self, retry_after=None):
+        """429 / 503 / captcha : débit divisé par deux et pause (Retry-After si fourni)."""
+        with self._lock:
+            self._decrease(0.5)
+            delay = retry_after if retry_after is not None else 1.0 / self.rate
+            delay *= random.uniform(1.0, 1.5)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            self._tokens = 0.0
+
+    def error(self):
+        """Erreur réseau ou 5xx : baisse si le taux d'erreurs lissé dépasse le seuil."""
+        with self._lock:
+            self.error_rate = self.alpha + (1 - self.alpha) * self.error_rate
+            self.healthy = 0
+            return self.error_rate > self.error_threshold and self._decrease(0.75)
+
+    def recover(self, latency=None):
+        """Réponse saine : hausse additive, sauf si la latence dérive de la référence."""
+        with self._lock:
+            self.error_rate *= 1 - self.alpha
+            if latency is not None:
+                self.latency = latency if self.latency is None else (
+                    self.alpha * latency + (1 - self.alpha) * self.latency)
+                if self.baseline is None or self.latency < self.baseline:
+                    self.baseline = self.latency
+                else:
+                    self.baseline += self.baseline_decay * (self.latency - self.baseline)
+                if self.latency > self.baseline * self.latency_factor:
+                    return self._decrease(0.8)
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+            self.healthy += 1
+            if self.healthy >= 50:
+                self.safe_rate = max(self.safe_rate, self.rate)
+            return False
+
+    def state(self):
+        return {"rate": round(self.safe_rate, 3),
+                "baseline_latency": round(self.baseline, 3) if self.baseline else None}
+
+
+class HostRateLimiter:
+    """Un TokenBucket par classe d'endpoint (hôte + service / listing / page / browser).
+
+    Chaque requête prend aussi un jeton dans le seau de son hôte, à débit fixe
+    `host_rate` (défaut : `max_rate`) : les classes d'un même hôte ont beau
+    monter chacune en AIMD, leur somme ne dépasse pas ce plafond.
+
+    Avec `state_path`, le débit sûr et la latence de référence de chaque
+    classe sont rechargés au démarrage et sauvegardés par `save()` : un run
+    reprend au dernier débit tenu sans incident.
+    """
+
+    def __init__(self, rate, burst=1.0, max_rate=None, state_path=None, host_rate=None):
+        self.rate = rate
+        self.burst = burst
+        self.max_rate = max_rate or rate * 4
+        self.host_rate = host_rate or self.max_rate
+        self._hosts = {}
+        self.state_path = state_path
+        self._saved = {}
+        if state_path and os.path.exists(state_path):
+            try:
+                with open(state_path, "r", encoding="utf-8") as f:
+                    self._saved = json.load(f).get("endpoints", {})
+            except (OSError, ValueError):
+                self._saved = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, rate):
+        """Limiteur dont l'état est dans KHAMSAT_THROTTLE_STATE (défaut : .cache/, à côté du cache HTTP)."""
+        state_path = os.environ.get("KHAMSAT_THROTTLE_STATE",
+                                    os.path.join(os.getcwd(), ".cache", "throttle_state.json"))
+        return cls(rate, state_path=state_path or None)
+
+    def bucket(self, url, endpoint=None):
+        endpoint = endpoint or endpoint_class(url)
+        with self._lock:
+            if endpoint not in self._buckets:
+                saved = self._saved.get(endpoint, {})
+                rate = min(self.max_rate, max(0.1, saved.get("rate") or self.rate))
+                bucket = TokenBucket(rate, self.burst, max_rate=self.max_rate)
+                bucket.baseline = saved.get("baseline_latency")
+                self._buckets[endpoint] = bucket
+            return self._buckets[endpoint]
+
+    def host_bucket(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = TokenBucket(self.host_rate, self.burst, max_rate=self.host_rate)
+            return self._hosts[host]
+
+    def acquire(self, url, endpoint=None):
+        start = time.monotonic()
+        self.bucket(url, endpoint).acquire()
+        self.host_bucket(url).acquire()
+        metrics.observe("rate_limit_wait_seconds", time.monotonic() - start,
+                        endpoint=endpoint or endpoint_class(url))
+
+    def backoff(self, url, retry_after=None, endpoint=None, reason="429"):
+        endpoint = endpoint or endpoint_class(url)
+        bucket = self.bucket(url, endpoint)
+        bucket.backoff(retry_after)
+        metrics.inc("rate_limit_backoffs_total", endpoint=endpoint, reason=reason)
+        metrics.set("rate_limit_rps", bucket.rate, endpoint=endpoint)
+
+    def error(self, url, endpoint=None):
+        endpoint = endpoint or endpoint_class(url)
+        bucket = self.bucket(url, endpoint)
+        if bucket.error():
+            metrics.inc("rate_limit_backoffs_total", endpoint=endpoint, reason="errors")
+            metrics.set("rate_limit_rps", bucket.rate, endpoint=endpoint)
+
+    def recover(self, url, latency=None, endpoint=None):
+        endpoint = endpoint or endpoint_class(url)
+        bucket = self.bucket(url, endpoint)
+        if bucket.recover(latency):
+            metrics.inc("rate_limit_backoffs_total", endpoint=endpoint, reason="latency")
+        metrics.set("rate_limit_rps", bucket.rate, endpoint=endpoint)
+
+    def save(self):
+        """Écrit l'état des classes utilisées (les autres classes du fichier sont conservées)."""
+        if not self.state_path:
+            return
+        with self._lock:
+            endpoints = dict(self._saved)
+            endpoints.update({endpoint: bucket.state() for endpoint, bucket in self._buckets.items()})
+        state = {"updated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                 "endpoints": dict(sorted(endpoints.items()))}
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        with atomic_open(self.state_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,156 @@
+from dataclasses import dataclass, field
+from typing import NamedTuple, Optional
+
+# Valeurs des CSV historiques pour les champs absents
+NOT_FOUND = "Non trouvé"
+NO_REVIEW = "Aucun avis"
+UNKNOWN = "Inconnu"
+NO_TAGS = "Aucun tag"
+NO_IMAGE = "N/A"
+ERROR = "Erreur"
+
+# Chiffres arabes-indiens (٠-٩) et persans (۰-۹) -> ASCII
+DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "0123456789" * 2)
+
+
+def parse_int(text):
+    """Entier contenu dans un texte ("(12)", "١٢ مشتري", "1,250") ; None sans chiffre."""
+    if text is None:
+        return None
+    digits = "".join(c for c in str(text).translate(DIGITS) if "0" <= c <= "9")
+    return int(digits) if digits else None
+
+
+def _text(value, missing):
+    """Champ texte lu depuis un CSV : None si c'est la valeur des champs absents."""
+    return None if value in ("", missing) else value
+
+
+class Listing(NamedTuple):
+    """Carte de service d'un listing (ordre de LISTINGS_HEADER)."""
+    category: str
+    title: str
+    link: str
+    img_src: str = NO_IMAGE
+
+
+@dataclass(slots=True)
+class Category:
+    """Nœud de l'arbre des catégories (ligne des fichiers sous_categories)."""
+    name: str
+    url: str
+    parent: str = ""
+    depth: int = 1
+    leaf: bool = True
+
+    def as_row(self):
+        return [self.name, self.url, self.parent, str(self.depth), "1" if self.leaf else "0"]
+
+
+@dataclass(slots=True)
+class ServiceDetail:
+    """Détails d'un service, nombres déjà convertis ; None pour un champ absent."""
+    link: str
+    status: str = "success"
+    title: Optional[str] = None
+    owner: Optional[str] = None
+    buyers: Optional[int] = None
+    votes: Optional[int] = None
+    last_date: Optional[str] = None
+    cat_main: Optional[str] = None
+    cat_sub: Optional[str] = None
+    keywords: tuple = field(default=())
+    verified_at: str = ""
+    # Cause d'un échec (status "error"), non écrite dans les CSV
+    error: Optional[str] = None
+
+    @classmethod
+    def from_fields(cls, fields, tags, link):
+        """Depuis les textes bruts des champs (None si absent) et la liste des tags."""
+        return cls(
+            link=link,
+            title=fields.get("title"),
+            owner=fields.get("owner"),
+            buyers=parse_int(fields.get("buyers")),
+            votes=parse_int(fields.get("votes")),
+            last_date=fields.get("last_date"),
+            cat_main=fields.get("cat_main"),
+            cat_sub=fields.get("cat_sub"),
+            keywords=tuple(tag for tag in tags if tag),
+        )
+
+    @classmethod
+    def from_row(cls, row):
+        """Depuis une ligne de détails (ordre de DETAILS_HEADER)."""
+        title, owner, buyers, votes, last_date, cat_main, cat_sub, keywords, link = row[:9]
+        verified_at = row[9] if len(row) > 9 else ""
+        if title == ERROR:
+            return cls(link=link, status="error", verified_at=verified_at)
+        return cls(
+            link=link,
+            title=_text(title, NOT_FOUND),
+            owner=_text(owner, NOT_FOUND),
+            buyers=parse_int(buyers),
+            votes=parse_int(votes),
+            last_date=_text(last_date, NO_REVIEW),
+            cat_main=_text(cat_main, UNKNOWN),
+            cat_sub=_text(cat_sub, UNKNOWN),
+            keywords=tuple(tag for tag in keywords.split(", ") if tag) if keywords != NO_TAGS else (),
+            verified_at=verified_at,
+        )
+
+    @property
+    def category(self):
+        return f"{self.cat_main or UNKNOWN} > {self.cat_sub or UNKNOWN}"
+
+    def missing(self, names):
+        """Champs de `names` restés absents."""
+        return [name for name in names if getattr(self, name) is None]
+
+    def as_row(self, verified_at=None):
+        """Ligne CSV (ordre de DETAILS_HEADER), avec les valeurs historiques des champs absents."""
+        verified_at = self.verified_at if verified_at is None else verified_at
+        if self.status == "error":
+            return [ERROR, ERROR, "0", "0", "0", ERROR, ERROR, ERROR, self.link, verified_at]
+        return [
+            self.title or NOT_FOUND,
+            self.owner or NOT_FOUND,
+            NOT_FOUND if self.buyers is None else str(self.buyers),
+            NOT_FOUND if self.votes is None else str(self.votes),
+            self.last_date or NO_REVIEW,
+            self.cat_main or UNKNOWN,
+            self.cat_sub or UNKNOWN,
+            ", ".join(self.keywords) or NO_TAGS,
+            self.link,
+            verified_at,
+        ]
+
+
+class RecordBatch:
+    """Lot d'enregistrements stocké par colonnes (une liste par champ).
+
+    Les écritures se font par lot : `rows()` pour les CSV et SQLite,
+    `columns` pour un format colonnes (Parquet).
+    """
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        self.columns = {name: [] for name in self.names}
+
+    def append(self, row):
+        for name, value in zip(self.names, row):
+            self.columns[name].append(value)
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return len(self.columns[self.names[0]]) if self.names else 0
+
+    def rows(self):
+        return [list(row) for row in zip(*(self.columns[name] for name in self.names))]
+
+    def clear(self):
+        for values in self.columns.values():
+            values.clear()
@@ -0,0 +1,80 @@
+import hashlib
+
+from progress_store import ProgressStore, load_entries
+
+
+def listing_signature(categories, title, img_src):
+    """Empreinte des signaux visibles dans les listings (catégories, titre, image)."""
+    data = "\x1f".join(sorted(categories)) + "\x1e" + title + "\x1e" + img_src
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()[:16]
+
+
+def read_listing_signatures(rows):
+    """Lignes de listing (catégorie, titre, lien, image) -> {lien: signature}, dans l'ordre."""
+    listings = {}
+    for row in rows:
+        if len(row) < 3 or not row[2].strip():
+            continue
+        category, title, link = row[0], row[1], row[2].strip()
+        img_src = row[3] if len(row) > 3 else ""
+        entry = listings.setdefault(link, [set(), title, img_src])
+        entry[0].add(category)
+    return {link: listing_signature(*entry) for link, entry in listings.items()}
+
+
+def open_verified(progress_dir, base_name):
+    """Store des services vérifiés, une entrée "signature lien" par service."""
+    return ProgressStore(progress_dir, f"verified_{base_name}")
+
+
+def parse_verified(store):
+    verified = {}
+    for entry in store:
+        signature, _, link = entry.partition(" ")
+        verified[link] = signature
+    return verified
+
+
+class RefreshPlan:
+    """Comparaison du listing courant avec l'état vérifié au dernier passage."""
+
+    def __init__(self, signatures, verified):
+        self.signatures = signatures
+        self.new = [link for link in signatures if link not in verified]
+        self.changed = [link for link in signatures
+                        if link in verified and verified[link] != signatures[link]]
+        self.removed = [link for link in verified if link not in signatures]
+        self.unchanged = {link for link in signatures if verified.get(link) == signatures[link]}
+
+    @property
+    def todo(self):
+        """Services à (re)scraper, dans l'ordre du fichier source."""
+        todo = set(self.new) | set(self.changed)
+        return [link for link in self.signatures if link in todo]
+
+    def entry(self, link):
+        return f"{self.signatures[link]} {link}"
+
+
+def plan_refresh(storage, source, store):
+    """Calcule nouveaux / modifiés / retirés / inchangés pour une source de listing.
+
+    Au premier passage (store vide), les services ayant déjà une ligne de
+    détails valide sont considérés comme vérifiés avec leur signature actuelle.
+    """
+    signatures = read_listing_signatures(storage.iter_listings(source))
+    verified = parse_verified(store)
+    if not verified:
+        verified = {link: signatures[link] for link in storage.detail_links(source)
+                    if link in signatures}
+    plan = RefreshPlan(signatures, verified)
+    # Le store ne garde que les services encore listés et inchangés
+    store.replace(plan.entry(link) for link in plan.unchanged)
+    return plan
+
+
+def pending_count(storage, source, progress_dir):
+    """Nombre de services restant à vérifier pour une source de listing."""
+    verified = parse_verified(load_entries(progress_dir, f"verified_{source}"))
+    signatures = read_listing_signatures(storage.iter_listings(source))
+    return sum(1 for link, signature in signatures.items() if verified.get(link) != signature)
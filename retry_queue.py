@@ -0,0 +1,123 @@
+import csv
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from fsutils import atomic_open
+from metrics import metrics
+
+# Causes d'échec définitives : le service n'existe plus
+PERMANENT_ERRORS = {"http_404", "http_410"}
+
+DEAD_LETTER_HEADER = ["Lien", "Source", "Type", "Erreur", "Tentatives", "Date"]
+
+
+def failure_kind(reason):
+    """Type d'échec : "permanent" (404, service retiré) ou "transient" (timeout, 5xx, captcha, Chrome...)."""
+    return "permanent" if reason in PERMANENT_ERRORS else "transient"
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+class RetryQueue:
+    """Services en échec, réessayés aux runs suivants avec un backoff exponentiel.
+
+    La file est persistée dans retry_queue.json. Un échec permanent, ou un
+    échec transitoire après `max_attempts` tentatives, envoie le service dans
+    dead_letter.csv : il n'est plus réessayé.
+    """
+
+    def __init__(self, directory, max_attempts=5, base_delay=1800):
+        self.path = os.path.join(directory, "retry_queue.json")
+        self.dead_letter_path = os.path.join(directory, "dead_letter.csv")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+        self.dead = set()
+        if os.path.exists(self.dead_letter_path):
+            with open(self.dead_letter_path, "r", newline="", encoding="utf-8-sig") as f:
+                reader = csv.reader(f)
+                next(reader, None)
+                self.dead = {row[0] for row in reader if row}
+
+    @classmethod
+    def from_env(cls, directory):
+        """File configurée par KHAMSAT_RETRY_MAX_ATTEMPTS et KHAMSAT_RETRY_BASE_MINUTES."""
+        return cls(directory,
+                   max_attempts=int(os.environ.get("KHAMSAT_RETRY_MAX_ATTEMPTS", "5")),
+                   base_delay=float(os.environ.get("KHAMSAT_RETRY_BASE_MINUTES", "30")) * 60)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, link):
+        return link in self.entries
+
+    def due(self, source, now=None):
+        """Liens de `source` dont le délai de backoff est écoulé, les plus anciens d'abord."""
+        now = (now or _now()).isoformat(timespec="seconds")
+        due = [(entry["next_retry"], link) for link, entry in self.entries.items()
+               if entry["source"] == source and entry["next_retry"] <= now]
+        return [link for _, link in sorted(due)]
+
+    def seed(self, source, links):
+        """Met en file des liens en erreur d'avant la file (réessayés sans délai)."""
+        added = 0
+        now = _now().isoformat(timespec="seconds")
+        for link in links:
+            if link in self.entries or link in self.dead:
+                continue
+            self.entries[link] = {"source": source, "attempts": 0, "error": "unknown",
+                                  "first_failed": now, "next_retry": now}
+            added += 1
+        return added
+
+    def fail(self, link, source, reason):
+        """Enregistre un échec ; retourne "retry" (remis en file) ou "dead" (abandonné)."""
+        now = _now()
+        entry = self.entries.setdefault(link, {"source": source, "attempts": 0,
+                                               "first_failed": now.isoformat(timespec="seconds")})
+        entry["source"] = source
+        entry["attempts"] += 1
+        entry["error"] = reason
+        kind = failure_kind(reason)
+        if kind == "permanent" or entry["attempts"] >= self.max_attempts:
+            self._dead_letter(link, entry, kind, now)
+            metrics.inc("retry_queue_total", outcome="dead", kind=kind)
+            return "dead"
+        delay = self.base_delay * 2 ** (entry["attempts"] - 1)
+        entry["next_retry"] = (now + timedelta(seconds=delay)).isoformat(timespec="seconds")
+        metrics.inc("retry_queue_total", outcome="retry", kind=kind)
+        return "retry"
+
+    def succeeded(self, link):
+        """Le service a été récupéré : il sort de la file."""
+        if self.entries.pop(link, None) is not None:
+            metrics.inc("retry_queue_total", outcome="recovered", kind="transient")
+
+    def forget(self, link):
+        """Le service n'est plus dans son listing : inutile de le réessayer."""
+        self.entries.pop(link, None)
+
+    def _dead_letter(self, link, entry, kind, now):
+        del self.entries[link]
+        self.dead.add(link)
+        is_new = not os.path.exists(self.dead_letter_path)
+        with open(self.dead_letter_path, "a", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            if is_new:
+                writer.writerow(DEAD_LETTER_HEADER)
+            writer.writerow([link, entry["source"], kind, entry["error"], entry["attempts"],
+                             now.strftime("%Y-%m-%d %H:%M")])
+
+    def save(self):
+        with atomic_open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1)
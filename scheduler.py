@@ -0,0 +1,127 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from fsutils import atomic_open
+from metrics import metrics
+from records import parse_int
+from storage import DETAILS_HEADER, DETAILS_VERIFIED
+
+DETAILS_BUYERS = DETAILS_HEADER.index("Acheteurs")
+
+
+def load_manifest(path):
+    """Manifeste "travail restant" du run précédent ; None s'il manque ou est illisible."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def service_priority(row):
+    """Clé de tri d'un service à scraper, d'après sa ligne de détails (None si inconnue).
+
+    Les services jamais scrapés passent d'abord, puis les plus achetés, puis
+    ceux vérifiés le moins récemment.
+    """
+    if row is None:
+        return 0, 0, ""
+    return 1, -(parse_int(row[DETAILS_BUYERS]) or 0), row[DETAILS_VERIFIED]
+
+
+class Scheduler:
+    """Budget de temps d'un run : n'admet plus de travail quand l'échéance approche.
+
+    Le coût d'un item est le temps de mur entre deux items terminés, à la
+    concurrence courante, lissé par une moyenne mobile exponentielle. Un item
+    n'est admis que si le temps restant couvre la marge et les items en vol.
+    """
+
+    def __init__(self, minutes=0, margin_minutes=5, alpha=0.1, seconds_per_item=None):
+        now = time.monotonic()
+        self.deadline = now + minutes * 60 if minutes > 0 else None
+        self.margin = margin_minutes * 60
+        self.alpha = alpha
+        self.seconds_per_item = seconds_per_item
+        self.admitted = 0
+        self.completed = 0
+        self.stopped = False
+        self._last = None
+
+    @classmethod
+    def from_env(cls, manifest_path=None):
+        """Scheduler configuré par KHAMSAT_DEADLINE_MINUTES (0 = sans échéance).
+
+        Le coût observé au run précédent, s'il est dans le manifeste, sert
+        d'estimation initiale.
+        """
+        manifest = load_manifest(manifest_path) if manifest_path else None
+        return cls(
+            minutes=float(os.environ.get("KHAMSAT_DEADLINE_MINUTES", "0")),
+            margin_minutes=float(os.environ.get("KHAMSAT_DEADLINE_MARGIN_MINUTES", "5")),
+            seconds_per_item=(manifest or {}).get("seconds_per_item"),
+        )
+
+    def remaining(self):
+        """Secondes restantes avant l'échéance (infini sans échéance)."""
+        if self.deadline is None:
+            return float("inf")
+        return self.deadline - time.monotonic()
+
+    def in_flight(self):
+        return self.admitted - self.completed
+
+    def has_time(self, items=1):
+        """Le budget permet-il de terminer `items` de plus en plus de ceux en vol ?"""
+        if self.stopped:
+            return False
+        cost = (self.in_flight() + items) * (self.seconds_per_item or 0)
+        if self.remaining() > self.margin + cost:
+            return True
+        self.stopped = True
+        return False
+
+    def admit(self, items):
+        """Laisse passer les items tant que le budget le permet."""
+        for item in items:
+            if not self.has_time():
+                return
+            if self._last is None:
+                self._last = time.monotonic()
+            self.admitted += 1
+            yield item
+
+    def done(self):
+        """Un item terminé : met à jour le coût estimé."""
+        now = time.monotonic()
+        if self._last is not None:
+            sample = now - self._last
+            if self.seconds_per_item is None:
+                self.seconds_per_item = sample
+            else:
+                self.seconds_per_item = self.alpha * sample + (1 - self.alpha) * self.seconds_per_item
+            metrics.set("scheduler_seconds_per_item", round(self.seconds_per_item, 4))
+        self._last = now
+        self.completed += 1
+
+    def pause(self):
+        """Fin d'un lot : le temps jusqu'au prochain item admis n'est pas un coût d'item."""
+        self._last = None
+
+    def write_manifest(self, path, remaining):
+        """Écrit le manifeste lu par l'étape de relance du workflow."""
+        total = sum(remaining.values())
+        manifest = {
+            "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "complete": total == 0,
+            "deadline_reached": self.stopped,
+            "remaining": total,
+            "sources": {source: count for source, count in remaining.items() if count},
+            "seconds_per_item": round(self.seconds_per_item, 4) if self.seconds_per_item else None,
+            "estimated_minutes": round(total * (self.seconds_per_item or 0) / 60, 1),
+        }
+        with atomic_open(path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return manifest
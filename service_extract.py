@@ -0,0 +1,116 @@
+from lxml import etree
+from lxml import html as lxml_html
+
+from http_client import FetchError, fetch
+from parse_pool import INLINE
+from records import ServiceDetail
+
+# Champ -> XPath. Mêmes sélecteurs que le mode Selenium ; un champ absent vaut
+# None dans ServiceDetail (valeurs historiques rétablies à l'écriture CSV).
+FIELD_XPATHS = {
+    "title": '//h1',
+    "owner": '//div[@id="service_owner"]//a[contains(@class, "sidebar_user")]',
+    "buyers": '//div[contains(@class, "col-6")][span[contains(text(), "المشترين")]]/following-sibling::div[1]/span',
+    "votes": '//div[contains(@class, "col-6")][span[contains(text(), "التقييمات")]]/following-sibling::div[1]//li[contains(@class, "info")]',
+    "last_date": '//*[@id="reviews-section"]//div[contains(@class, "review_section")][1]//div[contains(@class, "meta--date")]/span[2]',
+    "cat_main": '//ol[contains(@class, "breadcrumb")]//li[2]//a',
+    "cat_sub": '//ol[contains(@class, "breadcrumb")]//li[3]//a',
+}
+TAGS_XPATH = '//ul[contains(@class, "c-list--tags")]//li//a'
+
+# Sans ces champs, la page n'est pas exploitable : on passe par Selenium
+REQUIRED_FIELDS = ("title", "owner", "cat_main")
+
+# Mode Selenium : la page est prête quand le titre est présent, puis tous les
+# champs sont lus en une seule évaluation JS, chacun avec sa durée (ms)
+READY_XPATH = FIELD_XPATHS["title"]
+EXTRACT_FIELDS_JS = """
+const spec = arguments[0];
+const first = (xpath) => document.evaluate(
+    xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+const out = {};
+for (const [field, xpath] of Object.entries(spec.fields)) {
+    const start = performance.now();
+    const node = first(xpath);
+    out[field] = [node ? node.textContent.trim() : null, performance.now() - start];
+}
+const start = performance.now();
+const snapshot = document.evaluate(
+    spec.tags, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+const tags = [];
+for (let i = 0; i < snapshot.snapshotLength; i++) {
+    const text = snapshot.snapshotItem(i).textContent.trim();
+    if (text) tags.push(text);
+}
+out.keywords = [tags, performance.now() - start];
+return out;
+"""
+EXTRACT_FIELDS_ARGS = {"fields": FIELD_XPATHS, "tags": TAGS_XPATH}
+
+
+def parse_service_html(content, link):
+    """Extrait les détails d'un service (ServiceDetail) depuis le HTML rendu côté serveur.
+
+    Une page illisible (corps vide d'une réponse 200...) donne un statut
+    "error" de cause "parse_error", transitoire pour la file de relance.
+    """
+    try:
+        tree = lxml_html.fromstring(content)
+    except (etree.ParserError, etree.XMLSyntaxError):
+        return ServiceDetail(link, status="error", error="parse_error")
+    fields = {}
+    for field, xpath in FIELD_XPATHS.items():
+        nodes = tree.xpath(xpath)
+        fields[field] = nodes[0].text_content().strip() if nodes else None
+    tags = [tag.text_content().strip() for tag in tree.xpath(TAGS_XPATH)]
+    return ServiceDetail.from_fields(fields, tags, link)
+
+
+def browser_result(raw, link):
+    """Convertit le retour de EXTRACT_FIELDS_JS en (ServiceDetail, durées par champ en ms)."""
+    fields = {}
+    timings = {}
+    for field in FIELD_XPATHS:
+        fields[field], timings[field] = raw.get(field) or (None, 0.0)
+    tags, timings["keywords"] = raw.get("keywords") or ([], 0.0)
+    return ServiceDetail.from_fields(fields, tags, link), timings
+
+
+class FieldTimings:
+    """Cumul des durées par champ (ms) pour repérer les sélecteurs lents."""
+
+    def __init__(self):
+        self.stats = {}
+
+    def add(self, timings):
+        for field, elapsed in timings.items():
+            count, total, peak = self.stats.get(field, (0, 0.0, 0.0))
+            self.stats[field] = (count + 1, total + elapsed, max(peak, elapsed))
+
+    def summary(self):
+        """Lignes "champ : moyenne / max", du plus lent au plus rapide."""
+        rows = sorted(self.stats.items(), key=lambda item: item[1][1] / item[1][0], reverse=True)
+        return [f"{field} : {total / count:.1f} ms moy. / {peak:.1f} ms max ({count} pages)"
+                for field, (count, total, peak) in rows]
+
+
+def missing_required(result):
+    """Liste des champs obligatoires absents de la page."""
+    return result.missing(REQUIRED_FIELDS)
+
+
+def fetch_service_details(session, link, limiter=None, cache=None, known=False, parser=None):
+    """Télécharge et analyse la page d'un service. Si la requête échoue, le statut
+    vaut "error" et `error` en donne la cause (voir http_client.FetchError).
+
+    Si la page n'a pas changé depuis le cache et que le service a déjà sa ligne
+    (`known`), le parsing est sauté et le statut vaut "unchanged". Le parsing
+    passe par `parser` (ParsePool) s'il est fourni.
+    """
+    try:
+        response = fetch(session, link, limiter, cache=cache, raise_errors=True)
+    except FetchError as e:
+        return ServiceDetail(link, status="error", error=e.reason)
+    if known and getattr(response, "unchanged", False):
+        return ServiceDetail(link, status="unchanged")
+    return (parser or INLINE).run(parse_service_html, response.content, link, page="service")
@@ -0,0 +1,141 @@
+import glob
+import os
+import re
+import sys
+
+from progress_store import url_digest
+from storage import DETAILS_LINK, open_storage
+
+SHARD_PATTERN = re.compile(r"^(\d+)/(\d+)$")
+DIRECTORY_PATTERN = re.compile(r"^shard_(\d+)_of_(\d+)$")
+
+
+class Shard:
+    """Partition déterministe de l'espace d'URLs entre N processus indépendants.
+
+    Le shard i/N (i de 0 à N-1) possède les clés dont l'empreinte blake2b vaut
+    i modulo N : le découpage est le même sur toutes les machines, sans
+    coordination. Avec N = 1, tout appartient à l'unique shard.
+    """
+
+    def __init__(self, index=0, count=1):
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"Shard invalide : {index}/{count}")
+        self.index = index
+        self.count = count
+
+    @classmethod
+    def parse(cls, value):
+        m = SHARD_PATTERN.match(value.strip())
+        if m is None:
+            raise ValueError(f"Shard invalide : {value!r} (attendu i/N, ex. 0/4)")
+        return cls(int(m.group(1)), int(m.group(2)))
+
+    @classmethod
+    def from_argv(cls, argv=None):
+        """Shard passé par `--shard i/N` (ou `--shard=i/N`), sinon par KHAMSAT_SHARD."""
+        argv = sys.argv[1:] if argv is None else argv
+        for i, arg in enumerate(argv):
+            if arg == "--shard" and i + 1 < len(argv):
+                return cls.parse(argv[i + 1])
+            if arg.startswith("--shard="):
+                return cls.parse(arg.split("=", 1)[1])
+        value = os.environ.get("KHAMSAT_SHARD", "")
+        return cls.parse(value) if value else cls()
+
+    @classmethod
+    def from_directory(cls, path):
+        """Shard d'un dossier shard_<i>_of_<N> (voir `directory`)."""
+        m = DIRECTORY_PATTERN.match(os.path.basename(os.path.normpath(path)))
+        if m is None:
+            raise ValueError(f"Dossier de shard invalide : {path}")
+        return cls(int(m.group(1)), int(m.group(2)))
+
+    @property
+    def enabled(self):
+        return self.count > 1
+
+    def owns(self, key):
+        return not self.enabled or url_digest(key) % self.count == self.index
+
+    def directory(self, base_dir):
+        """Dossier de travail du shard (progression, sorties) ; base_dir hors mode shard."""
+        if not self.enabled:
+            return base_dir
+        return os.path.join(base_dir, "shards", f"shard_{self.index}_of_{self.count}")
+
+    def open_storage(self, base_dir):
+        """Stockage propre au shard : KHAMSAT_DB est ignoré pour ne pas partager la base."""
+        directory = self.directory(base_dir)
+        db_path = os.path.join(directory, "khamsat.db") if self.enabled else None
+        return open_storage(directory, db_path=db_path)
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+
+def shard_directories(base_dir):
+    """Dossiers des shards présents sous <base_dir>/shards, dans l'ordre."""
+    paths = glob.glob(os.path.join(base_dir, "shards", "shard_*_of_*"))
+    return sorted(path for path in paths if os.path.isdir(path))
+
+
+class ShardStorage:
+    """Listings lus dans le stockage principal, limités aux liens du shard.
+
+    Détails, appartenances et écritures vont dans le stockage du shard
+    (`local`), que merge_shards.py fusionne ensuite dans le principal. Au
+    premier passage d'un shard, ses détails sont repris du principal : le
+    mode incrémental ne refait pas toute sa part des services.
+    """
+
+    def __init__(self, main, local, owns_link, batch_size=500):
+        self.main = main
+        self.local = local
+        self.owns_link = owns_link
+        self.batch_size = batch_size
+        self._seeded = set()
+
+    def _seed_details(self, source):
+        """Copie les détails du shard depuis le principal si le local n'en a aucun pour `source`."""
+        if source in self._seeded:
+            return
+        self._seeded.add(source)
+        if next(iter(self.local.iter_details(source)), None) is not None:
+            return
+        batch = []
+        for row in self.main.iter_details(source):
+            if self.owns_link(row[DETAILS_LINK]):
+                batch.append(row)
+            if len(batch) >= self.batch_size:
+                self.local.write_details(source, batch)
+                batch = []
+        self.local.write_details(source, batch)
+
+    def iter_details(self, source):
+        self._seed_details(source)
+        return self.local.iter_details(source)
+
+    def detail_links(self, source):
+        self._seed_details(source)
+        return self.local.detail_links(source)
+
+    def carry_forward(self, source, keep_links, verified_at, pending_links=()):
+        self._seed_details(source)
+        return self.local.carry_forward(source, keep_links, verified_at, pending_links)
+
+    def listing_sources(self):
+        return self.main.listing_sources()
+
+    def iter_listings(self, source):
+        for row in self.main.iter_listings(source):
+            link = row[2].strip()
+            if link and self.owns_link(link):
+                yield row
+
+    def __getattr__(self, name):
+        return getattr(self.local, name)
+
+    def close(self):
+        self.local.close()
+        self.main.close()
@@ -0,0 +1,286 @@
+"""Instantanés mensuels des détails et différences d'un mois à l'autre.
+
+Usage : python snapshot.py create [label]
+        python snapshot.py diff [label]
+        python snapshot.py history <lien>
+
+Chaque instantané est un fichier JSON par colonnes compressé (gzip),
+nommé par le hash de son contenu : deux mois identiques partagent le même
+fichier. La différence avec l'instantané précédent (services ajoutés,
+retirés, champs modifiés, avec anciennes et nouvelles valeurs) est écrite
+à côté, et le manifeste liste les instantanés. Seuls les KHAMSAT_SNAPSHOT_KEEP
+derniers fichiers complets sont gardés : les mois plus anciens sont
+reconstruits en remontant les différences, à la date du dernier avis près
+(texte relatif, qui change tous les mois et n'est pas suivi).
+
+Seuls le manifeste et les différences sont versionnés : les objets
+(objects/, ignorés par git) voyagent dans l'archive de données du workflow.
+"""
+import gzip
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+from fsutils import atomic_open
+from records import ServiceDetail
+from storage import open_storage
+
+SNAPSHOT_FORMAT = 1
+
+# Colonnes d'un instantané (en plus du lien, clé des lignes)
+SNAPSHOT_FIELDS = ("source", "title", "owner", "buyers", "votes", "last_date",
+                   "cat_main", "cat_sub", "keywords")
+# Champs comparés d'un mois à l'autre
+DIFF_FIELDS = tuple(name for name in SNAPSHOT_FIELDS if name != "last_date")
+
+KEEP = int(os.environ.get("KHAMSAT_SNAPSHOT_KEEP", "1"))
+
+
+def collect_rows(storage):
+    """{lien: ligne} des détails valides de toutes les sources (hors erreurs)."""
+    rows = {}
+    for source in sorted(storage.listing_sources()):
+        for row in storage.iter_details(source):
+            detail = ServiceDetail.from_row(row)
+            if detail.status == "error" or not detail.link:
+                continue
+            rows[detail.link] = {
+                "source": source,
+                "title": detail.title,
+                "owner": detail.owner,
+                "buyers": detail.buyers,
+                "votes": detail.votes,
+                "last_date": detail.last_date,
+                "cat_main": detail.cat_main,
+                "cat_sub": detail.cat_sub,
+                "keywords": list(detail.keywords),
+            }
+    return rows
+
+
+def encode(rows):
+    """Lignes -> JSON par colonnes (octets canoniques : mêmes lignes, mêmes octets)."""
+    links = sorted(rows)
+    data = {"link": links}
+    for name in SNAPSHOT_FIELDS:
+        data[name] = [rows[link][name] for link in links]
+    document = {"format": SNAPSHOT_FORMAT, "columns": ["link", *SNAPSHOT_FIELDS], "data": data}
+    return json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode(raw):
+    document = json.loads(raw)
+    data = document["data"]
+    names = [name for name in document["columns"] if name != "link"]
+    return {link: {name: data[name][i] for name in names} for i, link in enumerate(data["link"])}
+
+
+def write_gzip(path, raw):
+    # mtime=0 : le fichier compressé ne dépend que du contenu
+    with atomic_open(path, "wb") as f:
+        f.write(gzip.compress(raw, compresslevel=9, mtime=0))
+
+
+def read_gzip(path):
+    with open(path, "rb") as f:
+        return gzip.decompress(f.read())
+
+
+def diff_rows(old, new):
+    """Différence ligne à ligne, indexée par lien, réversible (anciennes valeurs incluses)."""
+    changed = {}
+    for link in old.keys() & new.keys():
+        fields = {name: [old[link][name], new[link][name]] for name in DIFF_FIELDS
+                  if old[link][name] != new[link][name]}
+        if fields:
+            changed[link] = fields
+    return {
+        "added": {link: new[link] for link in sorted(new.keys() - old.keys())},
+        "removed": {link: old[link] for link in sorted(old.keys() - new.keys())},
+        "changed": dict(sorted(changed.items())),
+    }
+
+
+def diff_counts(diff):
+    """Effectifs d'une différence, dont les variations d'acheteurs, notes et tags."""
+    counts = {"added": len(diff["added"]), "removed": len(diff["removed"]), "changed": len(diff["changed"])}
+    for name in ("buyers", "votes", "keywords"):
+        counts[f"{name}_changed"] = sum(1 for fields in diff["changed"].values() if name in fields)
+    return counts
+
+
+def revert(rows, diff):
+    """Applique une différence à l'envers : lignes du mois précédent (en place)."""
+    for link in diff["added"]:
+        rows.pop(link, None)
+    rows.update(diff["removed"])
+    for link, fields in diff["changed"].items():
+        for name, (before, _) in fields.items():
+            rows[link][name] = before
+    return rows
+
+
+class SnapshotStore:
+    """Dossier categories/snapshots : objets/<hash>.json.gz, diffs/<label>.json.gz, manifest.json."""
+
+    def __init__(self, base_dir):
+        self.root = os.path.join(base_dir, "snapshots")
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.diffs_dir = os.path.join(self.root, "diffs")
+        self.manifest_path = os.path.join(self.root, "manifest.json")
+        for directory in (self.objects_dir, self.diffs_dir):
+            os.makedirs(directory, exist_ok=True)
+        self.entries = []
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f).get("snapshots", [])
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, f"{digest}.json.gz")
+
+    def diff_path(self, label):
+        return os.path.join(self.diffs_dir, f"{label}.json.gz")
+
+    def index(self, label=None):
+        if not self.entries:
+            raise KeyError("aucun instantané")
+        if label is None:
+            return len(self.entries) - 1
+        for i, entry in enumerate(self.entries):
+            if entry["label"] == label:
+                return i
+        raise KeyError(f"instantané inconnu : {label}")
+
+    def read_diff(self, label):
+        path = self.diff_path(label)
+        if not os.path.exists(path):
+            return None
+        return json.loads(read_gzip(path))
+
+    def load(self, label=None):
+        """Lignes d'un instantané, reconstruites depuis un objet plus récent s'il a été élagué."""
+        target = self.index(label)
+        for i in range(target, len(self.entries)):
+            path = self.object_path(self.entries[i]["object"])
+            if os.path.exists(path):
+                rows = decode(read_gzip(path))
+                break
+        else:
+            raise FileNotFoundError("aucun objet d'instantané disponible")
+        for j in range(i, target, -1):
+            revert(rows, self.read_diff(self.entries[j]["label"]))
+        return rows
+
+    def create(self, storage, label=None, keep=KEEP):
+        """Instantané du stockage sous `label` (mois courant par défaut), qui remplace un homonyme."""
+        label = label or datetime.now(timezone.utc).strftime("%Y-%m")
+        rows = collect_rows(storage)
+        previous = [entry for entry in self.entries if entry["label"] != label]
+        try:
+            base = self.load(previous[-1]["label"]) if previous else None
+        except FileNotFoundError:
+            # Objets hors de git : sans l'archive de données, pas de diff possible
+            print(f"⚠️ Objet de l'instantané {previous[-1]['label']} introuvable, instantané sans diff")
+            base = None
+
+        raw = encode(rows)
+        digest = hashlib.sha256(raw).hexdigest()[:32]
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            write_gzip(path, raw)
+
+        entry = {
+            "label": label,
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "object": digest,
+            "rows": len(rows),
+            "bytes": os.path.getsize(path),
+        }
+        if base is not None:
+            diff = diff_rows(base, rows)
+            write_gzip(self.diff_path(label), json.dumps(diff, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            entry["previous"] = previous[-1]["label"]
+            entry["diff"] = diff_counts(diff)
+        elif os.path.exists(self.diff_path(label)):
+            os.remove(self.diff_path(label))
+
+        self.entries = previous + [entry]
+        self.prune(keep)
+        self.save()
+        return entry
+
+    def prune(self, keep):
+        """Ne garde que les objets des `keep` derniers instantanés (au moins le dernier)."""
+        kept = {entry["object"] for entry in self.entries[-max(keep, 1):]}
+        for name in os.listdir(self.objects_dir):
+            if name.endswith(".json.gz") and name[:-len(".json.gz")] not in kept:
+                os.remove(os.path.join(self.objects_dir, name))
+        labels = {entry["label"] for entry in self.entries}
+        for name in os.listdir(self.diffs_dir):
+            if name.endswith(".json.gz") and name[:-len(".json.gz")] not in labels:
+                os.remove(os.path.join(self.diffs_dir, name))
+
+    def save(self):
+        with atomic_open(self.manifest_path, "w", encoding="utf-8") as f:
+            json.dump({"format": SNAPSHOT_FORMAT, "snapshots": self.entries}, f, ensure_ascii=False, indent=2)
+
+    def history(self, link, fields=("buyers", "votes", "keywords")):
+        """Série temporelle d'un service : [{label, champs}] du plus ancien au plus récent.
+
+        Seul le dernier objet est lu ; les mois précédents sont obtenus en
+        remontant les différences du service.
+        """
+        row = self.load().get(link)
+        series = []
+        for i in range(len(self.entries) - 1, -1, -1):
+            if row is not None:
+                series.append({"label": self.entries[i]["label"], **{name: row[name] for name in fields}})
+            diff = self.read_diff(self.entries[i]["label"])
+            if diff is None:
+                break
+            if link in diff["added"]:
+                row = None
+            elif link in diff["removed"]:
+                row = dict(diff["removed"][link])
+            elif row is not None and link in diff["changed"]:
+                row = dict(row)
+                for name, (before, _) in diff["changed"][link].items():
+                    row[name] = before
+        return series[::-1]
+
+
+if __name__ == "__main__":
+    base_dir = os.path.join(os.getcwd(), "categories")
+    command = sys.argv[1] if len(sys.argv) > 1 else "create"
+    argument = sys.argv[2] if len(sys.argv) > 2 else None
+    store = SnapshotStore(base_dir)
+
+    if command == "create":
+        storage = open_storage(base_dir)
+        try:
+            entry = store.create(storage, argument)
+        finally:
+            storage.close()
+        print(f"📸 Instantané {entry['label']} : {entry['rows']} services, "
+              f"{entry['bytes'] / 1e6:.2f} Mo ({entry['object']})")
+        if "diff" in entry:
+            counts = entry["diff"]
+            print(f"🔀 Depuis {entry['previous']} : +{counts['added']} / -{counts['removed']} services, "
+                  f"{counts['changed']} modifiés (acheteurs {counts['buyers_changed']}, "
+                  f"notes {counts['votes_changed']}, tags {counts['keywords_changed']})")
+    elif command == "diff":
+        entry = store.entries[store.index(argument)]
+        diff = store.read_diff(entry["label"])
+        if diff is None:
+            print(f"ℹ️ {entry['label']} est le premier instantané")
+        else:
+            json.dump(diff, sys.stdout, ensure_ascii=False, indent=2)
+            print()
+    elif command == "history" and argument:
+        for point in store.history(argument):
+            print(json.dumps(point, ensure_ascii=False))
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,359 @@
+"""Statistiques sur l'ensemble des détails scrapés (tous runs confondus).
+
+Usage : python stats.py [--top N] [--no-cache]
+
+Lit chaque source de détails (CSV ou SQLite, selon KHAMSAT_STORAGE) en un
+seul passage et écrit Stats_<source>.txt et categories/stats/stats.json :
+catégories et sous-catégories, distributions des acheteurs et des notes,
+meilleurs vendeurs, tags les plus fréquents et ancienneté du dernier avis.
+Les agrégats de chaque source sont mis en cache ; une source n'est relue
+que si son fichier a changé (taille et mtime, puis hash du contenu).
+"""
+import hashlib
+import json
+import os
+import sys
+from collections import Counter
+
+from fsutils import atomic_open
+from records import DIGITS, ServiceDetail
+from storage import SQLiteStorage, open_storage
+
+CACHE_VERSION = 1
+
+# Bornes hautes des tranches d'acheteurs et de notes
+COUNT_BUCKETS = (0, 9, 49, 99, 499, 999)
+
+# Unités des dates relatives ("منذ 3 أشهر و5 أيام") : mot -> (nombre implicite, jours)
+AGE_UNITS = {
+    "سنة": (1, 365), "سنتين": (2, 365), "سنوات": (1, 365),
+    "شهر": (1, 30), "شهرين": (2, 30), "أشهر": (1, 30), "شهور": (1, 30),
+    "أسبوع": (1, 7), "أسبوعين": (2, 7), "أسابيع": (1, 7),
+    "يوم": (1, 1), "يومين": (2, 1), "أيام": (1, 1),
+    "ساعة": (1, 1 / 24), "ساعتين": (2, 1 / 24), "ساعات": (1, 1 / 24),
+    "دقيقة": (1, 1 / 1440), "دقيقتين": (2, 1 / 1440), "دقائق": (1, 1 / 1440),
+}
+
+# Tranches d'ancienneté du dernier avis : (borne haute en jours, libellé)
+RECENCY_BUCKETS = ((7, "< 1 semaine"), (30, "< 1 mois"), (182, "< 6 mois"), (365, "< 1 an"),
+                   (float("inf"), "≥ 1 an"))
+NO_REVIEW_LABEL = "Aucun avis"
+
+
+def review_age_days(text):
+    """Ancienneté en jours d'une date relative ("منذ سنة وشهرين") ; None si illisible."""
+    tokens = (text or "").translate(DIGITS).split()
+    if not tokens or tokens[0] != "منذ":
+        return None
+    days = 0.0
+    number = None
+    found = False
+    for token in tokens[1:]:
+        if token not in AGE_UNITS and token.startswith("و"):
+            token = token[1:]
+        if token.isdigit():
+            number = int(token)
+        elif token in AGE_UNITS:
+            implicit, unit = AGE_UNITS[token]
+            days += (number or implicit) * unit
+            number = None
+            found = True
+    return days if found else None
+
+
+def recency_label(detail):
+    if detail.last_date is None:
+        return NO_REVIEW_LABEL
+    age = review_age_days(detail.last_date)
+    if age is None:
+        return "Inconnue"
+    return next(label for bound, label in RECENCY_BUCKETS if age < bound)
+
+
+def bucket_label(value):
+    low = 0
+    for bound in COUNT_BUCKETS:
+        if value <= bound:
+            return f"{low}-{bound}" if low != bound else str(bound)
+        low = bound + 1
+    return f"{low}+"
+
+
+def distribution(values):
+    """Résumé d'une distribution {valeur: effectif} (quantiles exacts)."""
+    count = sum(values.values())
+    if not count:
+        return {"count": 0}
+    ordered = sorted(values.items())
+
+    def quantile(q):
+        target = q * count
+        seen = 0
+        for value, n in ordered:
+            seen += n
+            if seen >= target:
+                return value
+        return ordered[-1][0]
+
+    total = sum(value * n for value, n in ordered)
+    buckets = Counter()
+    for value, n in ordered:
+        buckets[bucket_label(value)] += n
+    return {
+        "count": count,
+        "sum": total,
+        "mean": round(total / count, 2),
+        "p50": quantile(0.5),
+        "p90": quantile(0.9),
+        "p99": quantile(0.99),
+        "max": ordered[-1][0],
+        "buckets": dict(buckets),
+    }
+
+
+class DetailStats:
+    """Agrégats d'une ou plusieurs sources de détails, fusionnables et sérialisables."""
+
+    COUNTERS = ("categories", "subcategories", "buyers", "votes", "owners", "owner_buyers",
+                "tags", "recency")
+    # Compteurs dont les clés sont des entiers (JSON les transforme en texte)
+    INT_KEYS = ("buyers", "votes")
+
+    def __init__(self):
+        self.total = 0
+        self.errors = 0
+        for name in self.COUNTERS:
+            setattr(self, name, Counter())
+
+    def add(self, detail):
+        self.total += 1
+        if detail.status == "error":
+            self.errors += 1
+            return
+        self.categories[detail.cat_main or "Inconnu"] += 1
+        self.subcategories[detail.category] += 1
+        if detail.buyers is not None:
+            self.buyers[detail.buyers] += 1
+        if detail.votes is not None:
+            self.votes[detail.votes] += 1
+        if detail.owner:
+            self.owners[detail.owner] += 1
+            self.owner_buyers[detail.owner] += detail.buyers or 0
+        self.tags.update(detail.keywords)
+        self.recency[recency_label(detail)] += 1
+
+    def merge(self, other):
+        self.total += other.total
+        self.errors += other.errors
+        for name in self.COUNTERS:
+            getattr(self, name).update(getattr(other, name))
+        return self
+
+    def as_dict(self):
+        data = {"total": self.total, "errors": self.errors}
+        data.update({name: dict(getattr(self, name)) for name in self.COUNTERS})
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.total = data["total"]
+        stats.errors = data["errors"]
+        for name in cls.COUNTERS:
+            values = data.get(name, {})
+            if name in cls.INT_KEYS:
+                values = {int(key): count for key, count in values.items()}
+            getattr(stats, name).update(values)
+        return stats
+
+    def report(self, top=20):
+        """Rapport JSON : effectifs triés, distributions et classements."""
+        sellers = sorted(self.owners, key=lambda owner: (-self.owner_buyers[owner], -self.owners[owner], owner))
+        return {
+            "total": self.total,
+            "success": self.total - self.errors,
+            "errors": self.errors,
+            "categories": dict(sorted(self.categories.items())),
+            "subcategories": dict(sorted(self.subcategories.items())),
+            "buyers": distribution(self.buyers),
+            "votes": distribution(self.votes),
+            "top_sellers": [{"owner": owner, "buyers": self.owner_buyers[owner], "services": self.owners[owner]}
+                            for owner in sellers[:top]],
+            "top_tags": dict(self.tags.most_common(top)),
+            "review_recency": {label: self.recency[label]
+                               for label in [label for _, label in RECENCY_BUCKETS] + ["Inconnue", NO_REVIEW_LABEL]
+                               if self.recency[label]},
+        }
+
+
+def details_files(backend, source):
+    """Fichiers dont dépendent les détails d'une source."""
+    if isinstance(backend, SQLiteStorage):
+        return [backend.db_path, backend.db_path + "-wal"]
+    return [backend.details_path(source)]
+
+
+def file_hash(paths):
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_signature(paths):
+    """[chemin, taille, mtime_ns] de chaque fichier (-1 s'il manque)."""
+    signature = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            signature.append([os.path.basename(path), st.st_size, st.st_mtime_ns])
+        except OSError:
+            signature.append([os.path.basename(path), -1, -1])
+    return signature
+
+
+class StatsCache:
+    """Agrégats par source, invalidés par la signature puis le hash des fichiers."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._hashes = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION:
+                self.entries = data.get("sources", {})
+        except (OSError, ValueError):
+            pass
+
+    def _hash(self, paths):
+        # Les sources SQLite partagent la base : un seul hash par run
+        key = tuple(paths)
+        if key not in self._hashes:
+            self._hashes[key] = file_hash(paths)
+        return self._hashes[key]
+
+    def get(self, source, paths):
+        """Agrégats en cache si les fichiers n'ont pas changé, sinon None."""
+        entry = self.entries.get(source)
+        if entry is None:
+            self.misses += 1
+            return None
+        signature = file_signature(paths)
+        if entry["files"] != signature:
+            # Fichier touché (mtime) : il n'a peut-être pas changé de contenu
+            if entry["hash"] != self._hash(paths):
+                self.misses += 1
+                return None
+            entry["files"] = signature
+        self.hits += 1
+        return DetailStats.from_dict(entry["stats"])
+
+    def put(self, source, paths, stats):
+        self.entries[source] = {"files": file_signature(paths), "hash": self._hash(paths),
+                                "stats": stats.as_dict()}
+
+    def save(self, sources):
+        """Écrit le cache (les sources disparues sont oubliées)."""
+        entries = {source: self.entries[source] for source in sources if source in self.entries}
+        with atomic_open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "sources": entries}, f, ensure_ascii=False)
+
+
+def source_stats(storage, source, cache=None):
+    """Agrégats d'une source, relus seulement si ses fichiers ont changé."""
+    backend = getattr(storage, "primary", storage)
+    backend.flush()
+    paths = details_files(backend, source)
+    stats = cache.get(source, paths) if cache else None
+    if stats is None:
+        stats = DetailStats()
+        for row in backend.iter_details(source):
+            stats.add(ServiceDetail.from_row(row))
+        if cache:
+            cache.put(source, paths, stats)
+    return stats
+
+
+def write_text_report(path, name, report):
+    with atomic_open(path, "w", encoding="utf-8") as f:
+        f.write(f"RAPPORT - {name}\n")
+        f.write("=" * 60 + "\n")
+        f.write(f"Total traités : {report['total']}\n")
+        f.write(f"Succès        : {report['success']}\n")
+        f.write(f"Erreurs       : {report['errors']}\n\n")
+        f.write("DÉTAILS PAR CATÉGORIE :\n")
+        for category, count in report["subcategories"].items():
+            f.write(f"- {category} : {count}\n")
+        for field, title in (("buyers", "ACHETEURS"), ("votes", "NOTES")):
+            dist = report[field]
+            f.write(f"\n{title} :\n")
+            if not dist["count"]:
+                f.write("- aucune valeur\n")
+                continue
+            f.write(f"- moyenne {dist['mean']}, médiane {dist['p50']}, p90 {dist['p90']}, max {dist['max']}\n")
+            for label, count in dist["buckets"].items():
+                f.write(f"- {label} : {count}\n")
+        f.write("\nMEILLEURS VENDEURS (acheteurs cumulés) :\n")
+        for seller in report["top_sellers"]:
+            f.write(f"- {seller['owner']} : {seller['buyers']} ({seller['services']} services)\n")
+        f.write("\nTAGS LES PLUS FRÉQUENTS :\n")
+        for tag, count in report["top_tags"].items():
+            f.write(f"- {tag} : {count}\n")
+        f.write("\nDERNIER AVIS :\n")
+        for label, count in report["review_recency"].items():
+            f.write(f"- {label} : {count}\n")
+
+
+def build_reports(storage, base_dir, top=20, use_cache=True):
+    """Régénère Stats_<source>.txt et stats.json ; retourne le rapport global."""
+    stats_dir = os.path.join(base_dir, "stats")
+    os.makedirs(stats_dir, exist_ok=True)
+    cache = StatsCache(os.path.join(stats_dir, "stats_cache.json")) if use_cache else None
+    backend = getattr(storage, "primary", storage)
+    # Rapports texte à côté des Details_*.csv (dossier stats sans backend CSV)
+    text_dir = getattr(backend, "details_dir", stats_dir)
+
+    sources = sorted(storage.listing_sources())
+    overall = DetailStats()
+    per_source = {}
+    for source in sources:
+        stats = source_stats(storage, source, cache)
+        overall.merge(stats)
+        report = stats.report(top)
+        per_source[source] = report
+        if stats.total:
+            write_text_report(os.path.join(text_dir, f"Stats_{source}.txt"), source, report)
+
+    result = {"overall": overall.report(top), "sources": per_source}
+    with atomic_open(os.path.join(stats_dir, "stats.json"), "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    write_text_report(os.path.join(stats_dir, "Stats_global.txt"), "Toutes sources", result["overall"])
+    if cache:
+        cache.save(sources)
+        result["cache"] = {"hits": cache.hits, "misses": cache.misses}
+    return result
+
+
+if __name__ == "__main__":
+    base_dir = os.path.join(os.getcwd(), "categories")
+    top = 20
+    if "--top" in sys.argv:
+        top = int(sys.argv[sys.argv.index("--top") + 1])
+    storage = open_storage(base_dir)
+    try:
+        result = build_reports(storage, base_dir, top, use_cache="--no-cache" not in sys.argv)
+    finally:
+        storage.close()
+    overall = result["overall"]
+    print(f"📊 {overall['total']} services ({overall['errors']} erreurs) dans {len(result['sources'])} sources")
+    if "cache" in result:
+        print(f"🗄️ Cache : {result['cache']['hits']} sources reprises, {result['cache']['misses']} recalculées")
+    print(f"📁 Rapports : {os.path.join(base_dir, 'stats')}")
@@ -0,0 +1,635 @@
+import csv
+import glob
+import os
+import sqlite3
+import sys
+
+from fsutils import atomic_open
+from records import Listing
+
+LISTINGS_HEADER = ["Catégorie", "Titre du Service", "Lien du Service", "Image URL"]
+# Colonnes de Details_*.csv ; "Vérifié le" est la date du dernier contrôle du service
+DETAILS_HEADER = ["Titre", "Vendeur", "Acheteurs", "Notes", "Date Dernier Avis",
+                  "Catégorie", "Sous-Catégorie", "Mots Clés", "Lien", "Vérifié le"]
+# Appartenance many-to-many service <-> (source, catégorie)
+MEMBERSHIP_HEADER = ["Service", "Lien", "Source", "Catégorie"]
+DETAILS_LINK = DETAILS_HEADER.index("Lien")
+DETAILS_VERIFIED = DETAILS_HEADER.index("Vérifié le")
+
+# Une "source" est le nom d'un fichier de listing, ex. "Resultats_تصميم" :
+# le backend CSV en dérive Resultats_<...>.csv et Details_Resultats_<...>.csv.
+
+
+def _pad(row, width):
+    return (list(row) + [""] * width)[:width]
+
+
+class CsvStorage:
+    """Backend historique : un CSV utf-8-sig par source, écrit par lots.
+
+    Les listings sont dédoublonnés par (catégorie, lien). Pour les détails,
+    une ligne dont le lien existe déjà remplace l'ancienne : elle est ajoutée
+    en fin de fichier et la lecture garde la dernière ligne de chaque lien
+    (à la place de la première). Les anciennes lignes sont retirées à la
+    prochaine réécriture du fichier, au plus tard à la fermeture.
+    """
+
+    def __init__(self, resultats_dir, details_dir, batch_size=100):
+        self.resultats_dir = resultats_dir
+        self.details_dir = details_dir
+        self.batch_size = batch_size
+        self._listing_seen = {}
+        self._listing_buffer = {}
+        self._detail_links = {}
+        self._detail_buffer = {}
+        # Sources dont le fichier contient des lignes remplacées
+        self._detail_superseded = set()
+        self._membership_seen = None
+        self._membership_buffer = []
+
+    # --- chemins ---
+    def listings_path(self, source):
+        return os.path.join(self.resultats_dir, f"{source}.csv")
+
+    def details_path(self, source):
+        return os.path.join(self.details_dir, f"Details_{source}.csv")
+
+    @property
+    def membership_path(self):
+        return os.path.join(self.details_dir, "Appartenances.csv")
+
+    # --- listings ---
+    def listing_sources(self):
+        paths = glob.glob(os.path.join(self.resultats_dir, "Resultats_*.csv"))
+        return sorted(os.path.splitext(os.path.basename(path))[0] for path in paths)
+
+    def iter_listings(self, source):
+        path = self.listings_path(source)
+        if not os.path.exists(path):
+            return
+        with open(path, "r", newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                if len(row) >= 3:
+                    yield Listing(*_pad(row, len(LISTINGS_HEADER)))
+
+    def write_listings(self, source, rows):
+        """Ajoute les lignes inédites ; retourne leur nombre."""
+        if source not in self._listing_seen:
+            self._listing_seen[source] = {(row[0], row[2]) for row in self.iter_listings(source)}
+        seen = self._listing_seen[source]
+        buffer = self._listing_buffer.setdefault(source, [])
+        added = 0
+        for row in rows:
+            key = (row[0], row[2])
+            if key not in seen:
+                seen.add(key)
+                buffer.append(row)
+                added += 1
+        if len(buffer) >= self.batch_size:
+            self._flush_listings(source)
+        return added
+
+    def _flush_listings(self, source):
+        rows = self._listing_buffer.pop(source, [])
+        path = self.listings_path(source)
+        if not os.path.exists(path):
+            with open(path, "w", newline="", encoding="utf-8-sig") as f:
+                csv.writer(f).writerow(LISTINGS_HEADER)
+        if rows:
+            with open(path, "a", newline="", encoding="utf-8-sig") as f:
+                csv.writer(f).writerows(rows)
+
+    def promote_listings(self, staging, source):
+        """Remplace le listing `source` par celui, complet, de `staging`."""
+        self._flush_listings(staging)
+        os.replace(self.listings_path(staging), self.listings_path(source))
+        self._listing_seen.pop(staging, None)
+        self._listing_seen.pop(source, None)
+
+    # --- détails ---
+    def _read_details(self, source):
+        """Lignes de détails, la dernière écrite pour chaque lien."""
+        path = self.details_path(source)
+        if not os.path.exists(path):
+            return
+        rows = {}
+        with open(path, "r", newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                if len(row) > DETAILS_LINK:
+                    rows[row[DETAILS_LINK]] = _pad(row, len(DETAILS_HEADER))
+        yield from rows.values()
+
+    def iter_details(self, source):
+        self.flush()
+        yield from self._read_details(source)
+
+    def detail_links(self, source):
+        """Liens ayant une ligne de détails valide (hors erreurs)."""
+        self.flush()
+        return {row[DETAILS_LINK] for row in self._read_details(source) if row[0] != "Erreur"}
+
+    def _prepare_details(self, source):
+        """Crée le fichier, ou ajoute les colonnes manquantes d'un ancien fichier."""
+        path = self.details_path(source)
+        if not os.path.exists(path):
+            with open(path, "w", newline="", encoding="utf-8-sig") as f:
+                csv.writer(f).writerow(DETAILS_HEADER)
+            return
+        with open(path, "r", newline="", encoding="utf-8-sig") as f:
+            header = next(csv.reader(f), [])
+        if header != DETAILS_HEADER:
+            self._rewrite_details(source, lambda row: row)
+
+    def _rewrite_details(self, source, transform):
+        """Réécrit Details_*.csv (une ligne par lien) ; `transform` renvoie la ligne à garder ou None."""
+        rows = list(self._read_details(source))
+        with atomic_open(self.details_path(source), "w", newline="", encoding="utf-8-sig") as dst:
+            writer = csv.writer(dst)
+            writer.writerow(DETAILS_HEADER)
+            for row in rows:
+                row = transform(row)
+                if row is not None:
+                    writer.writerow(row)
+        self._detail_superseded.discard(source)
+
+    def write_details(self, source, rows):
+        if source not in self._detail_links:
+            self._prepare_details(source)
+            self._detail_links[source] = {row[DETAILS_LINK] for row in self._read_details(source)}
+        links = self._detail_links[source]
+        buffer = self._detail_buffer.setdefault(source, [])
+        for row in rows:
+            row = _pad(row, len(DETAILS_HEADER))
+            link = row[DETAILS_LINK]
+            if link in links:
+                self._detail_superseded.add(source)
+            links.add(link)
+            buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self._flush_details(source)
+
+    def _flush_details(self, source):
+        """Ajoute les lignes en fin de fichier, y compris les remplacements (sans relire le fichier)."""
+        rows = self._detail_buffer.pop(source, [])
+        if rows:
+            with open(self.details_path(source), "a", newline="", encoding="utf-8-sig") as f:
+                csv.writer(f).writerows(rows)
+
+    def compact_details(self, source):
+        """Retire les lignes remplacées (une réécriture du fichier)."""
+        self._flush_details(source)
+        self._rewrite_details(source, lambda row: row)
+
+    def delete_details(self, source, links):
+        """Retire les lignes des liens `links` ; retourne leur nombre."""
+        self.flush()
+        links = set(links)
+        if not links or not os.path.exists(self.details_path(source)):
+            return 0
+        removed = 0
+
+        def drop(row):
+            nonlocal removed
+            if row[DETAILS_LINK] in links:
+                removed += 1
+                return None
+            return row
+
+        self._rewrite_details(source, drop)
+        if source in self._detail_links:
+            self._detail_links[source] -= links
+        return removed
+
+    def carry_forward(self, source, keep_links, verified_at, pending_links=()):
+        """Ne garde que les lignes valides de `keep_links`, horodatées, et celles de
+        `pending_links` telles quelles (à re-scraper, remplacées au prochain upsert).
+        Retourne le nombre de lignes horodatées."""
+        self.flush()
+        self._prepare_details(source)
+        written = set()
+        carried = 0
+
+        def keep(row):
+            nonlocal carried
+            link = row[DETAILS_LINK]
+            if row[0] == "Erreur" or link in written:
+                return None
+            if link in keep_links:
+                row[DETAILS_VERIFIED] = verified_at
+                carried += 1
+            elif link not in pending_links:
+                return None
+            written.add(link)
+            return row
+
+        self._rewrite_details(source, keep)
+        self._detail_links[source] = written
+        return carried
+
+    # --- appartenances ---
+    def iter_membership(self):
+        self._flush_membership()
+        if not os.path.exists(self.membership_path):
+            return
+        with open(self.membership_path, "r", newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                if len(row) >= len(MEMBERSHIP_HEADER):
+                    yield row
+
+    def write_membership(self, rows):
+        """Ajoute les couples (service, source, catégorie) inédits."""
+        if self._membership_seen is None:
+            self._membership_seen = {(row[0], row[2], row[3]) for row in self.iter_membership()}
+        for row in rows:
+            key = (row[0], row[2], row[3])
+            if key not in self._membership_seen:
+                self._membership_seen.add(key)
+                self._membership_buffer.append(row)
+        if len(self._membership_buffer) >= self.batch_size:
+            self._flush_membership()
+
+    def _flush_membership(self):
+        if not self._membership_buffer:
+            return
+        new_file = not os.path.exists(self.membership_path)
+        with open(self.membership_path, "a", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(MEMBERSHIP_HEADER)
+            writer.writerows(self._membership_buffer)
+        self._membership_buffer = []
+
+    def flush(self):
+        for source in list(self._listing_buffer):
+            self._flush_listings(source)
+        for source in list(self._detail_buffer):
+            self._flush_details(source)
+        self._flush_membership()
+
+    def close(self):
+        self.flush()
+        for source in list(self._detail_superseded):
+            self.compact_details(source)
+
+
+class SQLiteStorage:
+    """Backend SQLite (WAL) : upsert par (source, lien) comme les CSV, index par catégorie et vendeur."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS listings (
+        source TEXT NOT NULL,
+        category TEXT NOT NULL,
+        title TEXT,
+        link TEXT NOT NULL,
+        img TEXT
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS listings_key ON listings (source, category, link);
+    CREATE INDEX IF NOT EXISTS listings_link ON listings (link);
+
+    CREATE TABLE IF NOT EXISTS details (
+        source TEXT NOT NULL,
+        title TEXT,
+        owner TEXT,
+        buyers TEXT,
+        votes TEXT,
+        last_date TEXT,
+        cat_main TEXT,
+        cat_sub TEXT,
+        keywords TEXT,
+        link TEXT NOT NULL,
+        verified_at TEXT
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS details_key ON details (source, link);
+    CREATE INDEX IF NOT EXISTS details_by_link ON details (link);
+    CREATE INDEX IF NOT EXISTS details_source ON details (source);
+    CREATE INDEX IF NOT EXISTS details_category ON details (cat_main, cat_sub);
+    CREATE INDEX IF NOT EXISTS details_owner ON details (owner);
+
+    CREATE TABLE IF NOT EXISTS membership (
+        service TEXT NOT NULL,
+        link TEXT NOT NULL,
+        source TEXT NOT NULL,
+        category TEXT NOT NULL
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS membership_key ON membership (service, source, category);
+    CREATE INDEX IF NOT EXISTS membership_category ON membership (category);
+    """
+    DETAIL_COLUMNS = ["title", "owner", "buyers", "votes", "last_date",
+                      "cat_main", "cat_sub", "keywords", "link", "verified_at"]
+
+    def __init__(self, db_path, batch_size=500):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        # Les écritures passent par le thread principal ; check_same_thread
+        # permet seulement de fermer depuis un autre thread en fin de run
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        # Anciennes bases : une ligne par lien, toutes sources confondues
+        self.conn.execute("DROP INDEX IF EXISTS details_link")
+        self.conn.executescript(self.SCHEMA)
+        self._listing_buffer = []
+        self._detail_buffer = []
+        self._membership_buffer = []
+
+    # --- listings ---
+    def listing_sources(self):
+        return [row[0] for row in self.conn.execute(
+            "SELECT DISTINCT source FROM listings WHERE source LIKE 'Resultats_%' ORDER BY source")]
+
+    def iter_listings(self, source):
+        self.flush()
+        cursor = self.conn.execute(
+            "SELECT category, title, link, img FROM listings WHERE source = ? ORDER BY rowid", (source,))
+        for row in cursor:
+            yield Listing(*row)
+
+    def write_listings(self, source, rows):
+        before = self.conn.total_changes
+        self._listing_buffer.extend((source, *row[:4]) for row in rows)
+        self._flush_listings()
+        return self.conn.total_changes - before
+
+    def _flush_listings(self):
+        if self._listing_buffer:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO listings (source, category, title, link, img) VALUES (?, ?, ?, ?, ?)",
+                    self._listing_buffer)
+            self._listing_buffer = []
+
+    def promote_listings(self, staging, source):
+        self.flush()
+        with self.conn:
+            self.conn.execute("DELETE FROM listings WHERE source = ?", (source,))
+            self.conn.execute("UPDATE listings SET source = ? WHERE source = ?", (source, staging))
+
+    # --- détails ---
+    def iter_details(self, source):
+        self.flush()
+        columns = ", ".join(self.DETAIL_COLUMNS)
+        cursor = self.conn.execute(
+            f"SELECT {columns} FROM details WHERE source = ? ORDER BY rowid", (source,))
+        for row in cursor:
+            yield ["" if value is None else value for value in row]
+
+    def detail_links(self, source):
+        self.flush()
+        return {row[0] for row in self.conn.execute(
+            "SELECT link FROM details WHERE source = ? AND title != 'Erreur'", (source,))}
+
+    def write_details(self, source, rows):
+        self._detail_buffer.extend((source, *_pad(row, len(DETAILS_HEADER))) for row in rows)
+        if len(self._detail_buffer) >= self.batch_size:
+            self._flush_details()
+
+    def _flush_details(self):
+        if not self._detail_buffer:
+            return
+        columns = ["source"] + self.DETAIL_COLUMNS
+        updates = ", ".join(f"{col} = excluded.{col}" for col in columns if col not in ("source", "link"))
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO details ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT(source, link) DO UPDATE SET {updates}",
+                self._detail_buffer)
+        self._detail_buffer = []
+
+    def carry_forward(self, source, keep_links, verified_at, pending_links=()):
+        self.flush()
+        with self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep_links (link TEXT PRIMARY KEY, pending INTEGER)")
+            self.conn.execute("DELETE FROM keep_links")
+            self.conn.executemany("INSERT OR IGNORE INTO keep_links VALUES (?, 0)", ((l,) for l in keep_links))
+            self.conn.executemany("INSERT OR IGNORE INTO keep_links VALUES (?, 1)", ((l,) for l in pending_links))
+            self.conn.execute(
+                "DELETE FROM details WHERE source = ? "
+                "AND (title = 'Erreur' OR link NOT IN (SELECT link FROM keep_links))",
+                (source,))
+            cursor = self.conn.execute(
+                "UPDATE details SET verified_at = ? WHERE source = ? "
+                "AND link IN (SELECT link FROM keep_links WHERE pending = 0)", (verified_at, source))
+        return cursor.rowcount
+
+    def delete_details(self, source, links):
+        self.flush()
+        with self.conn:
+            cursor = self.conn.executemany("DELETE FROM details WHERE source = ? AND link = ?",
+                                           ((source, link) for link in links))
+        return max(cursor.rowcount, 0)
+
+    # --- appartenances ---
+    def iter_membership(self):
+        self.flush()
+        for row in self.conn.execute("SELECT service, link, source, category FROM membership ORDER BY rowid"):
+            yield list(row)
+
+    def write_membership(self, rows):
+        self._membership_buffer.extend(tuple(row[:4]) for row in rows)
+        if len(self._membership_buffer) >= self.batch_size:
+            self._flush_membership()
+
+    def _flush_membership(self):
+        if self._membership_buffer:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO membership (service, link, source, category) VALUES (?, ?, ?, ?)",
+                    self._membership_buffer)
+            self._membership_buffer = []
+
+    # --- lectures indexées ---
+    def details_by_category(self, cat_main, cat_sub=None):
+        query = "SELECT * FROM details WHERE cat_main = ?"
+        params = [cat_main]
+        if cat_sub is not None:
+            query += " AND cat_sub = ?"
+            params.append(cat_sub)
+        return self.conn.execute(query, params).fetchall()
+
+    def details_by_owner(self, owner):
+        return self.conn.execute("SELECT * FROM details WHERE owner = ?", (owner,)).fetchall()
+
+    def flush(self):
+        self._flush_listings()
+        self._flush_details()
+        self._flush_membership()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+class Storage:
+    """Combine un ou plusieurs backends : les écritures vont à tous, les lectures au premier."""
+
+    def __init__(self, backends):
+        self.backends = backends
+        self.primary = backends[0]
+
+    def listing_sources(self):
+        return self.primary.listing_sources()
+
+    def iter_listings(self, source):
+        return self.primary.iter_listings(source)
+
+    def iter_details(self, source):
+        return self.primary.iter_details(source)
+
+    def detail_links(self, source):
+        return self.primary.detail_links(source)
+
+    def write_listings(self, source, rows):
+        rows = list(rows)
+        added = [backend.write_listings(source, rows) for backend in self.backends]
+        return added[0]
+
+    def promote_listings(self, staging, source):
+        for backend in self.backends:
+            backend.promote_listings(staging, source)
+
+    def write_details(self, source, rows):
+        rows = list(rows)
+        for backend in self.backends:
+            backend.write_details(source, rows)
+
+    def iter_membership(self):
+        return self.primary.iter_membership()
+
+    def write_membership(self, rows):
+        rows = list(rows)
+        for backend in self.backends:
+            backend.write_membership(rows)
+
+    def delete_details(self, source, links):
+        links = set(links)
+        counts = [backend.delete_details(source, links) for backend in self.backends]
+        return counts[0]
+
+    def carry_forward(self, source, keep_links, verified_at, pending_links=()):
+        counts = [backend.carry_forward(source, keep_links, verified_at, pending_links)
+                  for backend in self.backends]
+        return counts[0]
+
+    def flush(self):
+        for backend in self.backends:
+            backend.flush()
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
+
+
+def open_storage(base_dir, kinds=None, db_path=None):
+    """Ouvre les backends listés dans KHAMSAT_STORAGE ("csv", "sqlite" ou "sqlite,csv").
+
+    `db_path` impose la base SQLite (sinon KHAMSAT_DB ou <base_dir>/khamsat.db).
+    """
+    kinds = kinds or os.environ.get("KHAMSAT_STORAGE", "csv")
+    backends = []
+    for kind in (k.strip() for k in kinds.split(",")):
+        if kind == "csv":
+            resultats_dir = os.path.join(base_dir, "resultats")
+            details_dir = os.path.join(base_dir, "details_services")
+            for directory in (resultats_dir, details_dir):
+                os.makedirs(directory, exist_ok=True)
+            backends.append(CsvStorage(resultats_dir, details_dir))
+        elif kind == "sqlite":
+            db_path = db_path or os.environ.get("KHAMSAT_DB", os.path.join(base_dir, "khamsat.db"))
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            db = SQLiteStorage(db_path)
+            if not db.listing_sources():
+                # Base neuve à côté de CSV existants : elle part de leur contenu
+                import_csv(db, os.path.join(base_dir, "resultats"), os.path.join(base_dir, "details_services"))
+            backends.append(db)
+        else:
+            raise ValueError(f"Backend de stockage inconnu : {kind}")
+    return Storage(backends)
+
+
+def import_csv(db, resultats_dir, details_dir):
+    """Remplit la base SQLite `db` (SQLiteStorage) à partir des CSV historiques.
+
+    Pendant de export_csv ; retourne le nombre de sources importées.
+    """
+    src = CsvStorage(resultats_dir, details_dir)
+    sources = src.listing_sources()
+    for source in sources:
+        db.write_listings(source, src.iter_listings(source))
+        db.write_details(source, src.iter_details(source))
+        db.flush()
+        print(f"✅ {source} importé")
+    db.write_membership(src.iter_membership())
+    db.flush()
+    return len(sources)
+
+
+def export_csv(db_path, resultats_dir, details_dir):
+    """Régénère les CSV historiques à partir de la base SQLite."""
+    for directory in (resultats_dir, details_dir):
+        os.makedirs(directory, exist_ok=True)
+    db = SQLiteStorage(db_path)
+    out = CsvStorage(resultats_dir, details_dir)
+    try:
+        for source in db.listing_sources():
+            with atomic_open(out.listings_path(source), "w", newline="", encoding="utf-8-sig") as f:
+                writer = csv.writer(f)
+                writer.writerow(LISTINGS_HEADER)
+                writer.writerows(db.iter_listings(source))
+            with atomic_open(out.details_path(source), "w", newline="", encoding="utf-8-sig") as f:
+                writer = csv.writer(f)
+                writer.writerow(DETAILS_HEADER)
+                writer.writerows(db.iter_details(source))
+            print(f"✅ {source} exporté")
+        with atomic_open(out.membership_path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(MEMBERSHIP_HEADER)
+            writer.writerows(db.iter_membership())
+    finally:
+        db.close()
+
+
+def export_parquet(db_path, output_dir):
+    """Exporte les tables en Parquet (nécessite pyarrow)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("❌ pyarrow n'est pas installé (pip install pyarrow)")
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    try:
+        for table in ("listings", "details", "membership"):
+            cursor = conn.execute(f"SELECT * FROM {table}")
+            names = [column[0] for column in cursor.description]
+            columns = list(zip(*cursor.fetchall())) or [[] for _ in names]
+            pq.write_table(pa.table(dict(zip(names, map(list, columns)))),
+                           os.path.join(output_dir, f"{table}.parquet"))
+            print(f"✅ {table}.parquet écrit")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    # python storage.py export [--parquet] | import
+    base_dir = os.path.join(os.getcwd(), "categories")
+    db_path = os.environ.get("KHAMSAT_DB", os.path.join(base_dir, "khamsat.db"))
+    if len(sys.argv) < 2 or sys.argv[1] not in ("export", "import"):
+        print("Usage : python storage.py export [--parquet] | import")
+        sys.exit(1)
+    if sys.argv[1] == "import":
+        db = SQLiteStorage(db_path)
+        try:
+            import_csv(db, os.path.join(base_dir, "resultats"), os.path.join(base_dir, "details_services"))
+        finally:
+            db.close()
+    elif "--parquet" in sys.argv:
+        export_parquet(db_path, os.path.join(base_dir, "parquet"))
+    else:
+        export_csv(db_path, os.path.join(base_dir, "resultats"), os.path.join(base_dir, "details_services"))
@@ -0,0 +1,118 @@
+import csv
+import os
+import re
+from urllib.parse import urljoin, urlparse
+
+from lxml import html as lxml_html
+
+CATEGORY = "category"
+SUBCATEGORY = "subcategory"
+SERVICE = "service"
+USER = "user"
+OTHER = "other"
+
+BASE_URL = "https://khamsat.com/"
+
+
+def canonical_url(url):
+    """URL normalisée : https, sans www, sans query / fragment ni slash final."""
+    parsed = urlparse(urljoin(BASE_URL, url.strip()))
+    netloc = parsed.netloc.lower()
+    if netloc.startswith("www."):
+        netloc = netloc[4:]
+    return f"https://{netloc}{parsed.path.rstrip('/')}"
+
+
+class UrlClassifier:
+    """Classe les liens khamsat en une seule regex compilée depuis l'arbre des catégories.
+
+    Seul le premier segment des URLs de catégories est retenu :
+    /<catégorie> est une catégorie, /<catégorie>/<sous>/... une sous-catégorie,
+    /<catégorie>/<sous>/<id>-<slug> un service et /user/<nom> un profil.
+    """
+
+    def __init__(self, category_urls, host="khamsat.com"):
+        self.host = host
+        roots = {urlparse(url).path.strip("/").split("/")[0] for url in category_urls}
+        roots.discard("")
+        # Les racines les plus longues d'abord pour que l'alternation ne coupe pas un nom
+        alternation = "|".join(re.escape(root) for root in sorted(roots, key=len, reverse=True))
+        self._pattern = re.compile(
+            r"^/(?:"
+            r"(?P<user>user)/[^/]+"
+            rf"|(?P<root>{alternation})"
+            r"(?:(?P<parent>(?:/[^/]+)+?)/(?P<service>\d+)(?:-[^/]*)?|(?P<sub>(?:/[^/]+)*))"
+            r")/?$"
+        ) if roots else None
+
+    @classmethod
+    def from_csv(cls, path):
+        """Classifieur construit depuis categories_khamsat*.csv (colonne Lien)."""
+        with open(path, "r", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            return cls(row[1] for row in reader if len(row) >= 2)
+
+    def match(self, url):
+        """Retourne (type, match) ; match vaut None pour les liens hors arbre."""
+        parsed = urlparse(url)
+        if parsed.netloc and not parsed.netloc.endswith(self.host):
+            return OTHER, None
+        if parsed.query or self._pattern is None:
+            return OTHER, None
+        m = self._pattern.match(parsed.path)
+        if m is None:
+            return OTHER, None
+        if m.group("user"):
+            return USER, m
+        if m.group("service"):
+            return SERVICE, m
+        if m.group("sub"):
+            return SUBCATEGORY, m
+        return CATEGORY, m
+
+    def classify(self, url):
+        return self.match(url)[0]
+
+    def service_key(self, url):
+        """Clé de déduplication : "service:<id>" pour un service, sinon l'URL canonique.
+
+        L'id ne dépend ni du slug (qui suit le titre) ni de la sous-catégorie.
+        """
+        url = canonical_url(url)
+        kind, m = self.match(url)
+        if kind == SERVICE:
+            return f"service:{m.group('service')}"
+        return url
+
+    def classify_anchors(self, content, base_url=BASE_URL):
+        """Un seul passage sur les <a href> d'une page : [(type, url absolue, texte)]."""
+        tree = content if hasattr(content, "iterfind") else lxml_html.fromstring(content)
+        links = []
+        for anchor in tree.iterfind(".//a[@href]"):
+            url = urljoin(base_url, anchor.get("href"))
+            links.append((self.classify(url), url, anchor.text_content().strip()))
+        return links
+
+    def subcategories(self, content, parent_url):
+        """Sous-catégories [(nom, url)] situées sous `parent_url`, dans l'ordre de la page."""
+        prefix = urlparse(parent_url).path.rstrip("/") + "/"
+        found = []
+        seen = set()
+        for kind, url, text in self.classify_anchors(content, parent_url):
+            if kind != SUBCATEGORY or len(text) <= 2 or url in seen:
+                continue
+            path = urlparse(url).path
+            if path.startswith(prefix) and path.rstrip("/") + "/" != prefix:
+                found.append((text, url))
+                seen.add(url)
+        return found
+
+
+def load_classifier(base_dir):
+    """Classifieur des scripts, depuis le fichier de catégories principal ; None s'il manque."""
+    for name in ("categories_khamsat_xpath.csv", "categories_khamsat.csv"):
+        path = os.path.join(base_dir, name)
+        if os.path.exists(path):
+            return UrlClassifier.from_csv(path)
+    return None